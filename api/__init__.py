@@ -1,7 +1,8 @@
 from os import path, environ, pardir
 import sys
 sys.path.append(pardir)
-sys.path.append(path.join(pardir, 'model'))
+sys.path.append(
+    path.join(path.dirname(path.dirname(path.abspath(__file__))), 'model'))
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -39,7 +40,10 @@ db = SQLAlchemy()
 celery = Celery(__name__, broker=Config.CELERY_BROKER_URL)
 
 
-def create_app():
+def create_app(web: bool = True):
+    """ Create the app, with its routes unless it is for a Celery worker,
+        which only needs the database and the tasks
+    """
     app = Flask(__name__)
     if FLASK_ENV == 'development':
         app.config.from_object('config.DevConfig')
@@ -51,11 +55,25 @@ def create_app():
     db.init_app(app)
     celery.conf.update(app.config)
 
-    from . import api
-    app.register_blueprint(api.main)
-
-    with app.app_context():
+    if web:
         from . import api
+        app.register_blueprint(api.main)
+    else:
+        # Registers the tasks with celery
+        from . import tasks  # noqa: F401
 
+    from .commands import drop_legacy_tables
+    app.cli.add_command(drop_legacy_tables)
+
+    with app.app_context():
+        from .models import legacy_tables
+
+        legacy = legacy_tables(db.engine)
+        if legacy:
+            app.logger.warning(
+                'Tables %s are from an older version, run '
+                'flask drop-legacy-tables to replace them',
+                ', '.join(table.name for table in legacy)
+            )
         db.create_all()
         return app
@@ -1,52 +1,121 @@
 import sys
 import os
+import time
 from os.path import dirname, abspath, join
 
 sys.path.append(os.pardir)
 path = dirname(dirname(abspath(__file__)))
 sys.path.append(join(path, 'model'))
 
+from datetime import datetime
+from functools import lru_cache
 from typing import Tuple
 
 from flask import Flask, request, jsonify, redirect, url_for, \
-    render_template, abort, Blueprint
+    render_template, abort, Blueprint, Response, stream_with_context, g
 from flask import current_app as app
 from werkzeug.utils import secure_filename
 
 import pandas as pd
+from prometheus_client import CONTENT_TYPE_LATEST
 
 import model.apriori as apriori
+from model.recommend import recommend_baskets
 from model.visualize import plot_heatmap_plotly, plot_network_graph_plotly
 
-from . import db, tasks
+from . import cache, db, demo, loader, metrics, payload, recommend, \
+    tasks
+from .models import Dataset
+from .rule_index import MAX_PER_PAGE, PER_PAGE, RuleIndex
 
-main = Blueprint('main', __name__)
+# Results whose rule index is kept by each web process
+INDEXED_RESULTS = 16
 
+# Items recommended to a basket when none is requested, and the most
+RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 100
 
-def generate_rules_from_json() -> Tuple[pd.DataFrame, str]:
-    try:
-        df = pd.read_sql_table('transactions', con=db.engine)
-        metric = request.form.get('metric')
-        rules = tasks._rules_from_user_upload.delay(df.to_json(), metric)
-        res = rules.wait()
-        rules_df = pd.read_json(res)
-    except ValueError as ve:
-        abort(500, str(ve))
-
-    return rules_df, metric
+main = Blueprint('main', __name__)
 
 
-def before_request():
-    with db.engine.connect() as conn:
-        conn.execute('DROP TABLE IF EXISTS transactions')
-    db.session.commit()
+def job_rules(job_id: str) -> Tuple[pd.DataFrame, str, str]:
+    """ Rules computed by a finished job
+
+    Args:
+        job_id (str): The id returned by submit_job
+
+    Returns:
+        Tuple[pd.DataFrame, str, str]: The association rules, their metric,
+            and the dataset they were calculated from.
+    """
+    job = tasks._rules_from_user_upload.AsyncResult(job_id)
+    if not job.ready():
+        abort(409, f'Job {job_id} has not finished.')
+    if job.failed():
+        abort(500, str(job.result))
+    res = job.result
+    with metrics.timed('decoding'):
+        rules = payload.decode_rules(res['rules'])
+    return rules, res['metric'], res['dataset_id']
+
+
+@lru_cache(maxsize=INDEXED_RESULTS)
+def job_rule_index(job_id: str) -> Tuple[RuleIndex, str, str]:
+    """ job_rules indexed for paging, once per finished job """
+    rules_table, metric, dataset_id = job_rules(job_id)
+    return RuleIndex(rules_table), metric, dataset_id
+
+
+def rules_page(index: RuleIndex, metric: str):
+    """ A JSON page of rules selected by the query string
+
+    The query string may hold page (from 1), per_page, sort (a metric),
+    order ('desc' or 'asc'), and item, to only list the rules with that
+    item.
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', PER_PAGE, type=int)
+    sort = request.args.get('sort', metric)
+    order = request.args.get('order', 'desc')
+    item = request.args.get('item') or None
+    if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+        abort(400, f'page must be at least 1 and per_page between 1 and '
+                   f'{MAX_PER_PAGE}.')
+    if sort not in index.metrics:
+        abort(400, f'Cannot sort by {sort}.')
+    if order not in ('desc', 'asc'):
+        abort(400, f'Unknown order {order}.')
+    result = index.page(
+        sort,
+        descending=order == 'desc',
+        offset=(page - 1) * per_page,
+        limit=per_page,
+        item=item
+    )
+    return jsonify(
+        total=result.total,
+        page=page,
+        per_page=per_page,
+        sort=sort,
+        order=order,
+        item=item,
+        metrics=index.metrics,
+        rules=result.rules
+    )
 
 
-main.before_app_first_request(before_request)
+@main.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
 
 
 @main.after_request
 def after_request(response):
+    if 'request_start' in g:
+        metrics.REQUEST_SECONDS.labels(
+            request.endpoint or 'unknown',
+            response.status_code
+        ).observe(time.perf_counter() - g.request_start)
     with app.app_context():
         if app.config['DEBUG']:
             response.headers["Cache-Control"] = (
@@ -72,20 +141,39 @@ def upload_files():
         file_ext = os.path.splitext(filename)[1]
         if file_ext not in app.config['UPLOAD_EXTENSIONS']:
             return ".csv, .xls, or .xlsx files only!", 400
-        transactions_df = pd.read_excel(uploaded_file.stream)
-        transactions_df.to_sql(
-            'transactions',
-            con=db.engine,
-            if_exists='replace',
-            index=False,
-            chunksize=500,
-            dtype={
-                'InvoiceNo': db.String,
-                'Description': db.String,
-                'Quantity': db.Integer
-            }
-        )
-    return '', 204  # This will be routed to completed route by Dropzone
+        try:
+            transactions_df = apriori.read_input_data(
+                filename,
+                uploaded_file.stream
+            )
+        except ValueError as ve:
+            return str(ve), 400
+        # Uploads with a dataset_id append their rows to that dataset
+        dataset_id = request.form.get('dataset_id')
+        if dataset_id:
+            dataset = Dataset.query.get(dataset_id)
+            if dataset is None:
+                return 'Unknown dataset', 404
+            # Rows are counted once they are loaded, which happens in a
+            # single transaction
+            loader.bulk_load(transactions_df, db.engine, dataset.id)
+            dataset.n_rows = Dataset.n_rows + len(transactions_df)
+            dataset.last_active = datetime.utcnow()
+            db.session.commit()
+        else:
+            # The rows reference the dataset, so it is committed first and
+            # deleted when they fail to load
+            dataset = Dataset(n_rows=len(transactions_df))
+            db.session.add(dataset)
+            db.session.commit()
+            try:
+                loader.bulk_load(transactions_df, db.engine, dataset.id)
+            except Exception:
+                loader.delete_datasets(db.engine, [dataset.id])
+                raise
+        # Dropzone routes this to the completed route of the dataset
+        return jsonify(dataset_id=dataset.id)
+    return '', 204
 
 
 @main.route('/data_example')
@@ -95,7 +183,10 @@ def show_example():
 
 @main.route('/completed')
 def completed():
-    return render_template('completed.html')
+    return render_template(
+        'completed.html',
+        dataset_id=request.args.get('dataset_id')
+    )
 
 
 @main.route('/demo_selection')
@@ -107,63 +198,181 @@ def demo_selection():
 def view_demo():
     metric = request.form.get('metric')
     viz_type = request.form.get('viz_type')
-    rules = apriori.run_demo()
-    rules_df = rules._asdict()[metric]
+    if metric not in demo.METRICS:
+        abort(400, f'Unknown metric {metric}.')
+    if viz_type not in demo.VIZ_TYPES:
+        viz_type = 'network'
     if viz_type == 'table':
         return render_template(
             'tables_demo.html',
             metric=metric,
-            table=rules_df.to_html(
-                index=False,
-                justify='center',
-                classes=['table table-bordered table-striped table-hover table-sm'])
-        )
-    elif viz_type == 'heatmap':
-        heatmap = plot_heatmap_plotly(rules_df, metric, show=False)
-        return render_template(
-            'plotly_output_demo.html',
-            plot=heatmap
-        )
-    else:
-        network_graph = plot_network_graph_plotly(rules_df, metric, show=False)
-        return render_template(
-            'plotly_output_demo.html',
-            plot=network_graph
+            rules_url=url_for('main.demo_rules_page', metric=metric)
         )
+    return render_template(
+        'plotly_output_demo.html',
+        plot=demo.demo_output(metric, viz_type)
+    )
+
+
+@main.route('/demo/rules/<metric>')
+def demo_rules_page(metric):
+    if metric not in demo.METRICS:
+        abort(404, f'Unknown metric {metric}.')
+    return rules_page(demo.demo_index(metric), metric)
 
 
-@main.route('/compute_rules', methods=['POST'])
-def display_association_rules():
-    rules_table, metric = generate_rules_from_json()
+@main.route('/submit_job', methods=['POST'])
+def submit_job():
+    dataset_id = request.form.get('dataset_id')
+    metric = request.form.get('metric')
+    if metric not in demo.METRICS:
+        abort(400, f'Unknown metric {metric}.')
+    if Dataset.query.get(dataset_id) is None:
+        return 'Upload a file before computing rules.', 404
+    job = tasks._rules_from_user_upload.delay(dataset_id, metric)
+    return jsonify(job_id=job.id), 202
+
+
+@main.route('/job_status/<job_id>')
+def job_status(job_id):
+    job = tasks._rules_from_user_upload.AsyncResult(job_id)
+    status = {'job_id': job_id, 'state': job.state}
+    if job.state == 'PROGRESS':
+        status['stage'] = job.info.get('stage')
+        if 'estimate' in job.info:
+            status['estimate'] = job.info['estimate']
+    elif job.state == 'SUCCESS':
+        status['profile'] = job.result.get('profile')
+    elif job.state == 'FAILURE':
+        status['error'] = str(job.result)
+    return jsonify(status)
+
+
+@main.route('/cache_stats')
+def cache_stats():
+    return jsonify(cache.get_rule_cache().stats())
+
+
+@main.route('/metrics')
+def prometheus_metrics():
+    return Response(
+        metrics.exposition(),
+        content_type=CONTENT_TYPE_LATEST
+    )
+
+
+@main.route('/compute_rules/<job_id>')
+def display_association_rules(job_id):
+    _, metric, dataset_id = job_rule_index(job_id)
     return render_template(
         'tables.html',
+        dataset_id=dataset_id,
         metric=metric,
-        table=rules_table.to_html(
-            index=False,
-            justify='center',
-            classes=['table table-bordered table-striped table-hover table-sm']))
+        rules_url=url_for('main.job_rules_page', job_id=job_id))
+
 
+@main.route('/rules/<job_id>')
+def job_rules_page(job_id):
+    index, metric, _ = job_rule_index(job_id)
+    return rules_page(index, metric)
 
-@main.route('/heatmap', methods=['POST'])
-def plot_heatmap():
-    rules_table, metric = generate_rules_from_json()
-    heatmap = plot_heatmap_plotly(rules_table, metric, show=False)
+
+@main.route('/heatmap/<job_id>')
+def plot_heatmap(job_id):
+    rules_table, metric, dataset_id = job_rules(job_id)
+    with metrics.timed('heatmap'):
+        heatmap = plot_heatmap_plotly(rules_table, metric, show=False)
     return render_template(
         'plotly_output.html',
+        dataset_id=dataset_id,
         plot=heatmap
     )
 
 
-@main.route('/network_graph', methods=['POST'])
-def plot_network_graph():
-    rules_table, metric = generate_rules_from_json()
-    network_graph = plot_network_graph_plotly(rules_table, metric, show=False)
+@main.route('/network_graph/<job_id>')
+def plot_network_graph(job_id):
+    rules_table, metric, dataset_id = job_rules(job_id)
+    with metrics.timed('network_graph'):
+        network_graph = plot_network_graph_plotly(
+            rules_table, metric, show=False)
     return render_template(
         'plotly_output.html',
+        dataset_id=dataset_id,
         plot=network_graph
     )
 
 
+@main.route('/recommend/<dataset_id>', methods=['POST'])
+def recommend_for_basket(dataset_id):
+    """ Items to recommend to a basket from the latest rules of a dataset
+
+    The JSON body holds items, the basket, and optionally metric, the
+    metric ranking the rules, and n, the most items returned.
+    """
+    body = request.get_json(silent=True) or {}
+    items = body.get('items')
+    metric = body.get('metric', 'confidence')
+    n = body.get('n', RECOMMENDATIONS)
+    if not isinstance(items, list):
+        abort(400, 'items must be a list of items.')
+    if not isinstance(n, int) or not 1 <= n <= MAX_RECOMMENDATIONS:
+        abort(400, f'n must be between 1 and {MAX_RECOMMENDATIONS}.')
+    index = recommend.get_registry().get(dataset_id)
+    if index is None:
+        abort(404, f'No rules computed for dataset {dataset_id}.')
+    if metric not in index.metrics:
+        abort(400, f'Cannot rank by {metric}.')
+    return jsonify(
+        dataset_id=dataset_id,
+        metric=metric,
+        recommendations=index.recommend(items, metric, n)
+    )
+
+
+@main.route('/recommend/<dataset_id>/batch', methods=['POST'])
+def recommend_for_baskets(dataset_id):
+    """ Recommendations for every basket of an uploaded file of
+        transactions, streamed as CSV while they are scored
+
+    The form holds file, in the format of uploads, and optionally metric
+    and n as for recommend_for_basket.
+    """
+    uploaded_file = request.files.get('file')
+    metric = request.form.get('metric', 'confidence')
+    n = request.form.get('n', RECOMMENDATIONS, type=int)
+    if uploaded_file is None or not uploaded_file.filename:
+        abort(400, 'Upload a file of baskets.')
+    if not 1 <= n <= MAX_RECOMMENDATIONS:
+        abort(400, f'n must be between 1 and {MAX_RECOMMENDATIONS}.')
+    index = recommend.get_registry().get(dataset_id)
+    if index is None:
+        abort(404, f'No rules computed for dataset {dataset_id}.')
+    if metric not in index.metrics:
+        abort(400, f'Cannot rank by {metric}.')
+    try:
+        transactions_df = apriori.read_input_data(
+            secure_filename(uploaded_file.filename),
+            uploaded_file.stream
+        )
+    except ValueError as ve:
+        return str(ve), 400
+    baskets, invoices, items = apriori.encode_baskets(transactions_df)
+
+    def rows():
+        header = True
+        for frame in recommend_baskets(
+                index, baskets, invoices, items, metric, n):
+            yield frame.to_csv(header=header, index=False)
+            header = False
+
+    return Response(
+        stream_with_context(rows()),
+        mimetype='text/csv',
+        headers={'Content-Disposition':
+                 'attachment; filename=recommendations.csv'}
+    )
+
+
 @main.errorhandler(500)
 def internal_error(error):
     return render_template('500.html', error=error), 500
@@ -0,0 +1,252 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import redis
+from flask import current_app
+
+HASHED_COLUMNS = ['InvoiceNo', 'Description', 'Quantity']
+
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """ Content hash of uploaded transactions
+
+    Args:
+        df (pd.DataFrame): DataFrame with columns
+            InvoiceNo, Description, and Quantity
+
+    Returns:
+        str: A hex digest that changes whenever any row changes, but not
+            when the same rows are read in another order.
+    """
+    hashes = pd.util.hash_pandas_object(
+        df[HASHED_COLUMNS].astype(str),
+        index=False
+    )
+    digest = hashlib.sha256(np.sort(hashes.to_numpy()).tobytes())
+    digest.update(str(len(df)).encode())
+    return digest.hexdigest()
+
+
+class RuleCache(ABC):
+    """ Mined rules keyed by the fingerprint of the transactions and the
+        mining parameters, with least recently used eviction once the
+        cache holds more than max_bytes and expiry after ttl seconds
+    """
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @staticmethod
+    def key(fingerprint: str, **params) -> str:
+        """ Cache key of a dataset fingerprint and mining parameters """
+        params = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(f'{fingerprint}:{params}'.encode()).hexdigest()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """ The value of a key, None on a miss """
+
+    @abstractmethod
+    def put(self, key: str, value: bytes) -> None:
+        """ Store a value, unless it is larger than the whole cache """
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """ Hit and miss counts, number of entries, and bytes stored """
+
+
+class RedisRuleCache(RuleCache):
+    """ Rule cache in Redis, shared by every web and worker process """
+    def __init__(
+            self,
+            client: redis.Redis,
+            max_bytes: int,
+            ttl: int,
+            prefix: str = 'rule_cache'):
+        super().__init__(max_bytes, ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def _name(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    def _forget(self, key: str) -> None:
+        size = self.client.hget(self._name('sizes'), key)
+        pipe = self.client.pipeline()
+        pipe.delete(self._name('data', key))
+        pipe.zrem(self._name('lru'), key)
+        pipe.hdel(self._name('sizes'), key)
+        if size is not None:
+            pipe.decrby(self._name('bytes'), int(size))
+        pipe.execute()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.client.get(self._name('data', key))
+        if value is None:
+            self.client.incr(self._name('misses'))
+            # Entries that reached their TTL still have bookkeeping
+            if self.client.hexists(self._name('sizes'), key):
+                self._forget(key)
+            return None
+        pipe = self.client.pipeline()
+        pipe.incr(self._name('hits'))
+        pipe.zadd(self._name('lru'), {key: time.time()})
+        pipe.execute()
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        if self.client.hexists(self._name('sizes'), key):
+            self._forget(key)
+        pipe = self.client.pipeline()
+        pipe.set(self._name('data', key), value, ex=self.ttl)
+        pipe.zadd(self._name('lru'), {key: time.time()})
+        pipe.hset(self._name('sizes'), key, len(value))
+        pipe.incrby(self._name('bytes'), len(value))
+        pipe.execute()
+
+        while int(self.client.get(self._name('bytes')) or 0) > self.max_bytes:
+            oldest = self.client.zrange(self._name('lru'), 0, 0)
+            if not oldest:
+                break
+            self._forget(oldest[0].decode())
+
+    def stats(self) -> dict:
+        hits, misses, stored = self.client.mget(
+            self._name('hits'),
+            self._name('misses'),
+            self._name('bytes')
+        )
+        return {
+            'hits': int(hits or 0),
+            'misses': int(misses or 0),
+            'entries': self.client.zcard(self._name('lru')),
+            'bytes': int(stored or 0)
+        }
+
+
+class DiskRuleCache(RuleCache):
+    """ Rule cache in a local directory, a stand-in for Redis when the web
+        process and the workers share a file system. File modification
+        times record when an entry was written and access times when it
+        was last read.
+    """
+    SUFFIX = '.arrow'
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int):
+        super().__init__(max_bytes, ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _bump(self, counter: str) -> None:
+        with open(self._path('counters.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counts = self._counters()
+            counts[counter] = counts.get(counter, 0) + 1
+            with open(self._path('counters.json'), 'w') as f:
+                json.dump(counts, f)
+
+    def _counters(self) -> dict:
+        try:
+            with open(self._path('counters.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _entries(self) -> list:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                try:
+                    entries.append((name, os.stat(self._path(name))))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def _expired(self, stat: os.stat_result) -> bool:
+        return time.time() - stat.st_mtime > self.ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key + self.SUFFIX)
+        try:
+            stat = os.stat(path)
+            if self._expired(stat):
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            self._bump('misses')
+            return None
+        self._bump('hits')
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key + self.SUFFIX)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(value)
+        os.replace(temp, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for name, stat in self._entries():
+            if self._expired(stat):
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+            else:
+                entries.append((name, stat))
+        total = sum(stat.st_size for _, stat in entries)
+        for name, stat in sorted(entries, key=lambda e: e[1].st_atime):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            total -= stat.st_size
+
+    def stats(self) -> dict:
+        counts = self._counters()
+        entries = [e for e in self._entries() if not self._expired(e[1])]
+        return {
+            'hits': counts.get('hits', 0),
+            'misses': counts.get('misses', 0),
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries)
+        }
+
+
+def rule_cache_from_url(url: str, max_bytes: int, ttl: int) -> RuleCache:
+    """ Redis cache for redis:// URLs, disk cache for directory paths """
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisRuleCache(redis.Redis.from_url(url), max_bytes, ttl)
+    return DiskRuleCache(url, max_bytes, ttl)
+
+
+def get_rule_cache() -> RuleCache:
+    """ The rule cache configured for the current app """
+    if 'rule_cache' not in current_app.extensions:
+        current_app.extensions['rule_cache'] = rule_cache_from_url(
+            current_app.config['RULE_CACHE_URL'],
+            max_bytes=current_app.config['RULE_CACHE_MAX_BYTES'],
+            ttl=current_app.config['RULE_CACHE_TTL']
+        )
+    return current_app.extensions['rule_cache']
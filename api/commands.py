@@ -0,0 +1,19 @@
+import click
+from flask.cli import with_appcontext
+
+from . import db
+from .models import drop_legacy_transactions
+
+
+@click.command('drop-legacy-tables')
+@with_appcontext
+def drop_legacy_tables() -> None:
+    """ Drop the tables left by older versions and create the current
+        ones. Run once when upgrading, before starting the app.
+    """
+    dropped = drop_legacy_transactions(db.engine)
+    db.create_all()
+    if dropped:
+        click.echo('Dropped ' + ', '.join(table.name for table in dropped))
+    else:
+        click.echo('No legacy tables')
@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+import model.apriori as apriori
+from model.visualize import plot_heatmap_plotly, plot_network_graph_plotly
+
+from .rule_index import RuleIndex
+
+METRICS = ('confidence', 'lift', 'leverage')
+VIZ_TYPES = ('table', 'heatmap', 'network')
+
+
+@lru_cache(maxsize=None)
+def demo_rules() -> apriori.Rules:
+    """ Rules of the demo dataset, mined once per process """
+    return apriori.run_demo()
+
+
+@lru_cache(maxsize=None)
+def demo_index(metric: str) -> RuleIndex:
+    """ The demo rules of a metric, indexed once per process for paging """
+    return RuleIndex(demo_rules()._asdict()[metric])
+
+
+@lru_cache(maxsize=None)
+def demo_output(metric: str, viz_type: str) -> str:
+    """ The demo rules of a metric plotted once per process
+
+    Args:
+        metric (str): One of METRICS
+        viz_type (str): 'heatmap' or 'network'
+
+    Returns:
+        str: The Plotly figure JSON.
+    """
+    rules_df = demo_rules()._asdict()[metric]
+    if viz_type == 'heatmap':
+        return plot_heatmap_plotly(rules_df, metric, show=False)
+    return plot_network_graph_plotly(rules_df, metric, show=False)
+
+
+def warm() -> None:
+    """ Index and plot every demo metric, so that forked workers share
+        them
+    """
+    for metric in METRICS:
+        demo_index(metric)
+        for viz_type in VIZ_TYPES:
+            if viz_type != 'table':
+                demo_output(metric, viz_type)
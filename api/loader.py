@@ -0,0 +1,249 @@
+import io
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import Table, func, select
+from sqlalchemy.engine import Engine
+
+from .models import Dataset, Transaction
+
+# Columns written for every uploaded row
+COLUMNS = ['dataset_id', 'InvoiceNo', 'Description', 'Quantity']
+
+# Number of rows rendered or inserted at a time
+BATCH_SIZE = 10_000
+
+
+def iter_frames(
+        df: pd.DataFrame,
+        dataset_id: str,
+        batch_size: int = BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """ Batches of the transactions in the column order of the table
+
+    Args:
+        df (pd.DataFrame): DataFrame with columns
+            InvoiceNo, Description, and Quantity
+        dataset_id (str): The dataset the rows belong to
+        batch_size (int, optional): The number of rows in each batch.
+            Defaults to BATCH_SIZE.
+
+    Yields:
+        Iterator[pd.DataFrame]: DataFrames with the columns COLUMNS and
+            None for missing descriptions.
+    """
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        descriptions = batch['Description'].astype(object)
+        yield pd.DataFrame({
+            'dataset_id': dataset_id,
+            'InvoiceNo': batch['InvoiceNo'].astype(str),
+            'Description': descriptions.where(descriptions.notna(), None),
+            'Quantity': batch['Quantity'].fillna(0).astype(int)
+        }, columns=COLUMNS)
+
+
+class CsvStream:
+    """ Read-only file object that renders DataFrames as CSV one batch at
+        a time, for COPY FROM STDIN without building the whole file
+    """
+    def __init__(self, frames: Iterator[pd.DataFrame]):
+        self._batches = (
+            frame.to_csv(header=False, index=False) for frame in frames
+        )
+        self._batch = io.StringIO()
+
+    def read(self, size: int = -1) -> str:
+        # Reads of the current batch do not copy the rest of it
+        chunks = []
+        while True:
+            data = self._batch.read(size)
+            chunks.append(data)
+            if size >= 0:
+                size -= len(data)
+                if size == 0:
+                    break
+            batch = next(self._batches, None)
+            if batch is None:
+                break
+            self._batch = io.StringIO(batch)
+        return ''.join(chunks)
+
+    readline = read
+
+
+def copy_postgres(
+        df: pd.DataFrame,
+        engine: Engine,
+        table: Table,
+        dataset_id: str) -> None:
+    """ Stream rows into Postgres with COPY FROM STDIN """
+    columns = ', '.join(f'"{name}"' for name in COLUMNS)
+    sql = f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, CsvStream(iter_frames(df, dataset_id)))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def insert_many(
+        df: pd.DataFrame,
+        engine: Engine,
+        table: Table,
+        dataset_id: str) -> None:
+    """ Insert rows with executemany inside a single transaction """
+    with engine.begin() as conn:
+        for frame in iter_frames(df, dataset_id):
+            rows = zip(*(frame[name].tolist() for name in COLUMNS))
+            conn.execute(
+                table.insert(),
+                [dict(zip(COLUMNS, row)) for row in rows]
+            )
+
+
+def bulk_load(df: pd.DataFrame, engine: Engine, dataset_id: str) -> None:
+    """ Add the rows of a dataset to the transactions table using the
+        database's bulk loading mechanism
+
+    Args:
+        df (pd.DataFrame): DataFrame with columns
+            InvoiceNo, Description, and Quantity
+        engine (Engine): The database to load into
+        dataset_id (str): The dataset the rows belong to
+    """
+    table = Transaction.__table__
+    if engine.dialect.name == 'postgresql':
+        copy_postgres(df, engine, table, dataset_id)
+    else:
+        insert_many(df, engine, table, dataset_id)
+
+
+def read_transactions(
+        engine: Engine,
+        dataset_id: str,
+        after_id: Optional[int] = None,
+        until_id: Optional[int] = None,
+        invoices: Tuple[Optional[str], Optional[str]] = (None, None)
+        ) -> pd.DataFrame:
+    """ Read the columns used for mining from the rows of a dataset
+
+    Args:
+        engine (Engine): The database to read from
+        dataset_id (str): The dataset to read
+        after_id (int, optional): Only read rows with a greater id.
+            Defaults to None.
+        until_id (int, optional): Only read rows with this id or less.
+            Defaults to None.
+        invoices (Tuple[Optional[str], Optional[str]], optional): Only
+            read invoices from the first, inclusive, to the second,
+            exclusive. None leaves that end open. Defaults to (None, None).
+
+    Returns:
+        pd.DataFrame: A DataFrame with columns
+            InvoiceNo, Description, and Quantity.
+    """
+    table = Transaction.__table__
+    query = select(
+        table.c.InvoiceNo,
+        table.c.Description,
+        table.c.Quantity
+    ).where(table.c.dataset_id == dataset_id)
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    if until_id is not None:
+        query = query.where(table.c.id <= until_id)
+    first, end = invoices
+    if first is not None:
+        query = query.where(table.c.InvoiceNo >= first)
+    if end is not None:
+        query = query.where(table.c.InvoiceNo < end)
+    with engine.connect() as conn:
+        return pd.read_sql_query(query, conn)
+
+
+def last_row_id(engine: Engine, dataset_id: str) -> Optional[int]:
+    """ The id of the last row added to a dataset """
+    table = Transaction.__table__
+    query = select(func.max(table.c.id)).where(
+        table.c.dataset_id == dataset_id)
+    with engine.connect() as conn:
+        return conn.execute(query).scalar()
+
+
+def appends_to_invoices(
+        engine: Engine,
+        dataset_id: str,
+        after_id: int,
+        until_id: Optional[int] = None) -> bool:
+    """ Whether rows added to a dataset after a row belong to invoices
+        that already had rows up to it
+
+    Args:
+        engine (Engine): The database to read from
+        dataset_id (str): The dataset to check
+        after_id (int): The last row of the invoices that came before
+        until_id (int, optional): Only check the added rows with this id
+            or less. Defaults to None.
+
+    Returns:
+        bool: True when an added row belongs to an earlier invoice.
+    """
+    table = Transaction.__table__
+    added = select(table.c.InvoiceNo).where(
+        table.c.dataset_id == dataset_id,
+        table.c.id > after_id
+    )
+    if until_id is not None:
+        added = added.where(table.c.id <= until_id)
+    query = select(table.c.id).where(
+        table.c.dataset_id == dataset_id,
+        table.c.id <= after_id,
+        table.c.InvoiceNo.in_(added)
+    ).limit(1)
+    with engine.connect() as conn:
+        return conn.execute(query).first() is not None
+
+
+def invoice_bounds(
+        engine: Engine,
+        dataset_id: str,
+        n_partitions: int) -> List[Optional[str]]:
+    """ Split the invoices of a dataset into ranges of similar size
+
+    Args:
+        engine (Engine): The database to read from
+        dataset_id (str): The dataset to split
+        n_partitions (int): The number of ranges
+
+    Returns:
+        List[Optional[str]]: Bounds where range i holds the invoices from
+            bounds[i] to bounds[i + 1], with None for the open ends.
+            Datasets with fewer invoices than n_partitions get fewer ranges.
+    """
+    table = Transaction.__table__
+    query = select(table.c.InvoiceNo).where(
+        table.c.dataset_id == dataset_id
+    ).distinct().order_by(table.c.InvoiceNo)
+    with engine.connect() as conn:
+        invoices = conn.execute(query).scalars().all()
+    step = len(invoices) / n_partitions
+    starts = sorted({int(i * step) for i in range(1, n_partitions)} - {0})
+    return [None] + [invoices[i] for i in starts] + [None]
+
+
+def delete_datasets(engine: Engine, dataset_ids: List[str]) -> None:
+    """ Delete datasets and their rows
+
+    Args:
+        engine (Engine): The database to delete from
+        dataset_ids (List[str]): The datasets to delete
+    """
+    transactions = Transaction.__table__
+    datasets = Dataset.__table__
+    with engine.begin() as conn:
+        conn.execute(transactions.delete().where(
+            transactions.c.dataset_id.in_(dataset_ids)))
+        conn.execute(datasets.delete().where(
+            datasets.c.id.in_(dataset_ids)))
@@ -0,0 +1,229 @@
+""" Prometheus histograms of the time and memory of each stage of rules
+    jobs and plot requests, and of the size of each job.
+
+Set PROMETHEUS_MULTIPROC_DIR to an empty directory when a service runs
+several processes, such as gunicorn or Celery workers, so that every
+process writes its metrics there and /metrics reports all of them. Celery
+workers serve their metrics on WORKER_METRICS_PORT.
+"""
+import os
+import re
+import resource
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, \
+    generate_latest, multiprocess, start_http_server
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Trace the allocations of Python code during each stage, which slows
+# every stage down
+TRACE_MEMORY = os.environ.get('TRACE_MEMORY', 'false').lower() == 'true'
+
+INF = float('inf')
+SECONDS_BUCKETS = (
+    .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, INF)
+# 1 MB to 32 GB
+BYTES_BUCKETS = tuple(2. ** power for power in range(20, 36)) + (INF,)
+# 1 to 10 million
+COUNT_BUCKETS = tuple(10. ** power for power in range(8)) + (INF,)
+
+STAGE_SECONDS = Histogram(
+    'mba_stage_seconds',
+    'Seconds spent in a stage of a rules job or request',
+    ['stage'],
+    buckets=SECONDS_BUCKETS
+)
+STAGE_PEAK_RSS = Histogram(
+    'mba_stage_peak_rss_bytes',
+    'Peak resident memory of the process during a stage',
+    ['stage'],
+    buckets=BYTES_BUCKETS
+)
+STAGE_TRACED_PEAK = Histogram(
+    'mba_stage_traced_peak_bytes',
+    'Peak memory allocated by Python during a stage, with TRACE_MEMORY',
+    ['stage'],
+    buckets=BYTES_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    'mba_job_seconds',
+    'Seconds to compute the rules of a job, by engine and by the power '
+    'of ten its invoices are at most',
+    ['engine', 'invoices'],
+    buckets=SECONDS_BUCKETS
+)
+JOB_SIZE = Histogram(
+    'mba_job_size',
+    'Invoices, items, frequent itemsets, and rules of a job',
+    ['dimension'],
+    buckets=COUNT_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'mba_request_seconds',
+    'Seconds to respond to a request, by endpoint and status',
+    ['endpoint', 'status'],
+    buckets=SECONDS_BUCKETS
+)
+
+
+def reset_peak_rss() -> None:
+    """ Reset the peak resident memory of the process, which Linux allows
+        by writing 5 to clear_refs
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    """ The peak resident memory of the process in bytes since it was last
+        reset, or since the process started where it cannot be reset
+    """
+    try:
+        with open('/proc/self/status') as f:
+            return int(re.search(r'^VmHWM:\s*(\d+)', f.read(), re.M)
+                       .group(1)) * 1024
+    except (OSError, AttributeError):
+        # Kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageTimer:
+    """ Times consecutive stages, each ending when the next one starts as
+        a progress callback reports them, and observes each one in the
+        stage histograms
+    """
+    def __init__(self):
+        # Stage -> seconds, peak_rss_bytes, and traced_peak_bytes
+        self.stages = {}
+        self._stage = None
+        self._start = None
+        # Allocations are only traced when nothing else traces them
+        self._tracing = TRACE_MEMORY and not tracemalloc.is_tracing()
+
+    def start(self, stage: str) -> None:
+        """ End the current stage, if any, and start another """
+        self._end()
+        self._stage = stage
+        reset_peak_rss()
+        if self._tracing:
+            # Restarting clears the peak, as reset_peak needs Python 3.9
+            tracemalloc.stop()
+            tracemalloc.start()
+        self._start = time.perf_counter()
+
+    def stop(self) -> Dict[str, dict]:
+        """ End the current stage, returning the records of every stage """
+        self._end()
+        if self._tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.stages
+
+    def _end(self) -> None:
+        if self._stage is None:
+            return
+        record = {
+            'seconds': time.perf_counter() - self._start,
+            'peak_rss_bytes': peak_rss()
+        }
+        if self._tracing:
+            record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            STAGE_TRACED_PEAK.labels(self._stage)\
+                .observe(record['traced_peak_bytes'])
+        STAGE_SECONDS.labels(self._stage).observe(record['seconds'])
+        STAGE_PEAK_RSS.labels(self._stage).observe(record['peak_rss_bytes'])
+        # A stage reported twice adds its time and keeps the highest peak
+        previous = self.stages.get(self._stage)
+        if previous is not None:
+            record = {
+                key: value + previous[key] if key == 'seconds'
+                else max(value, previous[key])
+                for key, value in record.items()
+            }
+        self.stages[self._stage] = record
+        self._stage = None
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """ Time a block of code as a stage """
+    timer = StageTimer()
+    timer.start(stage)
+    try:
+        yield
+    finally:
+        timer.stop()
+
+
+def magnitude(count: Optional[int]) -> str:
+    """ The lowest power of ten that is at least count, such as 1e3 for
+        1000, as a label of few values
+    """
+    if count is None:
+        return 'unknown'
+    return f'1e{len(str(count - 1)) if count > 1 else 0}'
+
+
+def observe_job(
+        stages: Dict[str, dict],
+        engine: Optional[str],
+        **counts: Optional[int]) -> dict:
+    """ Observe the duration and the size of a finished job
+
+    Args:
+        stages (Dict[str, dict]): The records of StageTimer.stop
+        engine (Optional[str]): The engine that mined the rules
+        **counts (Optional[int]): The invoices, items, itemsets, and rules
+            of the job, None when they are unknown
+
+    Returns:
+        dict: The profile of the job, its total seconds, stages, and counts
+    """
+    seconds = sum(record['seconds'] for record in stages.values())
+    JOB_SECONDS.labels(engine or 'unknown', magnitude(counts.get('invoices')))\
+        .observe(seconds)
+    for dimension, count in counts.items():
+        if count is not None:
+            JOB_SIZE.labels(dimension).observe(count)
+    return {'seconds': seconds, 'stages': stages, **counts}
+
+
+def clear_multiprocess_dir() -> None:
+    """ Remove the metrics of the processes of a previous run, once before
+        a service starts its processes
+    """
+    if MULTIPROC_DIR:
+        shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+def registry() -> CollectorRegistry:
+    """ The registry of this process, or of every process writing to the
+        multiprocess directory
+    """
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def exposition() -> bytes:
+    """ The metrics in the Prometheus text format """
+    return generate_latest(registry())
+
+
+def serve(port: int) -> None:
+    """ Serve the metrics on a port from a background thread, for
+        processes without a web server such as Celery workers
+    """
+    start_http_server(port, registry=registry())
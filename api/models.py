@@ -0,0 +1,89 @@
+import uuid
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Table, inspect
+from sqlalchemy.engine import Engine
+
+from . import db
+
+
+def new_dataset_id() -> str:
+    return uuid.uuid4().hex
+
+
+class Dataset(db.Model):
+    """ An upload of transactions """
+    __tablename__ = 'datasets'
+
+    id = db.Column(db.String(32), primary_key=True, default=new_dataset_id)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When rows were last appended or rules last computed. Datasets expire
+    # DATASET_RETENTION_HOURS after this, so appending keeps them.
+    last_active = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    n_rows = db.Column(db.Integer, default=0)
+    # Mining state of the rows up to mined_row_id, see model/incremental.py
+    mining_state = db.Column(db.Text)
+    mined_row_id = db.Column(db.Integer)
+    # Arrow IPC stream of the latest rules with every metric, and how many
+    # times they were computed. Web processes index them for /recommend.
+    rules = db.Column(db.LargeBinary)
+    rules_version = db.Column(db.Integer)
+
+
+class Transaction(db.Model):
+    """ A row of an upload. Rows of every dataset share this table and are
+        read through the indexes that lead with dataset_id.
+    """
+    __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_dataset_invoice', 'dataset_id', 'InvoiceNo'),
+        db.Index(
+            'ix_transactions_dataset_description',
+            'dataset_id',
+            'Description'
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(
+        db.String(32),
+        db.ForeignKey('datasets.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    InvoiceNo = db.Column(db.String)
+    Description = db.Column(db.String)
+    Quantity = db.Column(db.Integer)
+
+
+def legacy_tables(engine: Engine) -> List[Table]:
+    """ Tables left by older versions, a transactions table that kept a
+        single upload without a dataset_id or a datasets table without
+        mining state, rules, or last_active
+    """
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+
+    def columns(table: str) -> set:
+        return {column['name'] for column in inspector.get_columns(table)}
+
+    if 'datasets' in tables and not {
+            'mining_state', 'rules_version', 'last_active'
+            } <= columns('datasets'):
+        if 'transactions' in tables:
+            return [Transaction.__table__, Dataset.__table__]
+        return [Dataset.__table__]
+    if 'transactions' in tables and 'dataset_id' not in columns(
+            'transactions'):
+        return [Transaction.__table__]
+    return []
+
+
+def drop_legacy_transactions(engine: Engine) -> List[Table]:
+    """ Drop the tables left by older versions, returning them. Their
+        uploads are lost, which only matters for DATASET_RETENTION_HOURS.
+    """
+    tables = legacy_tables(engine)
+    for table in tables:
+        table.drop(engine)
+    return tables
@@ -0,0 +1,66 @@
+import base64
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from model.artifacts import rules_to_table, table_to_rules
+
+
+def rules_to_arrow(
+        rules: pd.DataFrame,
+        itemsets: Optional[int] = None) -> bytes:
+    """ Serialize association rules to the Arrow IPC stream format
+
+    Args:
+        rules (pd.DataFrame): association rules with frozenset
+            antecedents and consequents and numeric metric columns
+        itemsets (int, optional): The number of frequent itemsets the
+            rules were generated from, kept in the schema metadata.
+            Defaults to None.
+
+    Returns:
+        bytes: The rules as an Arrow IPC stream. Itemsets are stored as
+            lists of strings.
+    """
+    table = rules_to_table(rules)
+    if itemsets is not None:
+        table = table.replace_schema_metadata({'itemsets': str(itemsets)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def rules_from_arrow(data: bytes) -> pd.DataFrame:
+    """ Deserialize association rules written by rules_to_arrow
+
+    Args:
+        data (bytes): An Arrow IPC stream
+
+    Returns:
+        pd.DataFrame: The association rules with frozenset antecedents
+            and consequents.
+    """
+    return table_to_rules(pa.ipc.open_stream(data).read_all())
+
+
+def arrow_itemsets(data: bytes) -> Optional[int]:
+    """ The number of frequent itemsets stored by rules_to_arrow, without
+        reading the rules
+    """
+    metadata = pa.ipc.open_stream(data).schema.metadata or {}
+    itemsets = metadata.get(b'itemsets')
+    return int(itemsets) if itemsets is not None else None
+
+
+def encode_rules(rules: pd.DataFrame) -> str:
+    """ Arrow IPC bytes of the rules as base64 text, which can pass
+        through Celery's JSON serializer
+    """
+    return base64.b64encode(rules_to_arrow(rules)).decode('ascii')
+
+
+def decode_rules(data: str) -> pd.DataFrame:
+    """ Rules from the output of encode_rules """
+    return rules_from_arrow(base64.b64decode(data))
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import current_app
+
+from model.recommend import RecommendIndex
+
+from . import db, payload
+from .models import Dataset
+
+
+class IndexRegistry:
+    """ The recommendation indexes of the most recently used datasets of a
+        web process. An index is replaced as a whole once the rules of its
+        dataset are recomputed, so requests never see a partial index.
+    """
+    def __init__(self, max_indexes: int, refresh_seconds: float):
+        self.max_indexes = max_indexes
+        self.refresh_seconds = refresh_seconds
+        # Dataset id -> (rules_version, index, time of the last check)
+        self._entries = OrderedDict()
+
+    def get(self, dataset_id: str) -> Optional[RecommendIndex]:
+        """ The index of the latest rules of a dataset, or None when the
+            dataset does not exist or has no rules yet
+        """
+        now = time.monotonic()
+        entry = self._entries.get(dataset_id)
+        if entry is not None and now - entry[2] < self.refresh_seconds:
+            self._entries.move_to_end(dataset_id)
+            return entry[1]
+
+        version = db.session.query(Dataset.rules_version)\
+            .filter_by(id=dataset_id).scalar()
+        if version is None:
+            self._entries.pop(dataset_id, None)
+            return None
+        if entry is None or entry[0] != version:
+            rules, version = db.session.query(
+                Dataset.rules, Dataset.rules_version
+            ).filter_by(id=dataset_id).one()
+            index = RecommendIndex(payload.rules_from_arrow(rules))
+        else:
+            index = entry[1]
+        self._entries[dataset_id] = (version, index, now)
+        self._entries.move_to_end(dataset_id)
+        while len(self._entries) > self.max_indexes:
+            self._entries.popitem(last=False)
+        return index
+
+
+def get_registry() -> IndexRegistry:
+    """ The recommendation indexes of the current app """
+    if 'recommend_indexes' not in current_app.extensions:
+        current_app.extensions['recommend_indexes'] = IndexRegistry(
+            current_app.config['RECOMMEND_INDEXES'],
+            current_app.config['RECOMMEND_REFRESH_SECONDS']
+        )
+    return current_app.extensions['recommend_indexes']
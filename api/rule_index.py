@@ -0,0 +1,143 @@
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from model.artifacts import ITEMSET_COLUMNS
+
+# Rules per page when none is requested, and the most a page may hold
+PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+Page = namedtuple('Page', ['total', 'rules'])
+
+
+def item_rows(rules: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """ Rows of the rules containing every item
+
+    Args:
+        rules (pd.DataFrame): association rules with frozenset
+            antecedents and consequents
+
+    Returns:
+        Dict[str, np.ndarray]: The ascending rows of the rules with each
+            item in their antecedents or consequents, by item name.
+    """
+    rows: Dict[str, list] = {}
+    for name in ITEMSET_COLUMNS:
+        for row, itemset in enumerate(rules[name]):
+            for item in itemset:
+                rows.setdefault(str(item).strip(), []).append(row)
+    return {
+        item: np.unique(np.array(item_rows, dtype=np.int64))
+        for item, item_rows in rows.items()
+    }
+
+
+class RuleIndex:
+    """ The rules of one result, ready to be served a page at a time. The
+        rules are sorted once per metric and direction, so a page costs
+        its size rather than a sort of every rule.
+    """
+
+    def __init__(self, rules: pd.DataFrame):
+        rules = rules.reset_index(drop=True)
+        self.metrics = [
+            name for name in rules.columns
+            if name not in ITEMSET_COLUMNS
+            and pd.api.types.is_numeric_dtype(rules[name])
+        ]
+        self._rules = rules
+        self._itemsets = {
+            name: rules[name].to_numpy(dtype=object)
+            for name in ITEMSET_COLUMNS
+        }
+        self._values = {
+            name: rules[name].to_numpy(dtype=float) for name in self.metrics
+        }
+        self._item_rows: Optional[Dict[str, np.ndarray]] = None
+        self._orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._ranks: Dict[Tuple[str, bool], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._itemsets['antecedents'])
+
+    def order(self, metric: str, descending: bool = True) -> np.ndarray:
+        """ Rows sorted by a metric, with missing values last """
+        key = metric, descending
+        if key not in self._orders:
+            values = self._values[metric]
+            self._orders[key] = np.argsort(
+                -values if descending else values, kind='stable')
+        return self._orders[key]
+
+    def rank(self, metric: str, descending: bool = True) -> np.ndarray:
+        """ Position of every row in order(metric, descending) """
+        key = metric, descending
+        if key not in self._ranks:
+            order = self.order(metric, descending)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            self._ranks[key] = rank
+        return self._ranks[key]
+
+    def page(
+            self,
+            metric: str,
+            descending: bool = True,
+            offset: int = 0,
+            limit: int = PER_PAGE,
+            item: Optional[str] = None) -> Page:
+        """ A page of rules sorted by a metric
+
+        Args:
+            metric (str): One of metrics, the column to sort by
+            descending (bool, optional): Highest values first.
+                Defaults to True.
+            offset (int, optional): The number of rules skipped.
+                Defaults to 0.
+            limit (int, optional): The most rules returned.
+                Defaults to PER_PAGE.
+            item (str, optional): Only rules with this item in their
+                antecedents or consequents. Defaults to None.
+
+        Raises:
+            KeyError: metric is not a metric of the rules
+
+        Returns:
+            Page: The number of rules matching the filter and the rules of
+                the page as JSON ready dicts.
+        """
+        if metric not in self._values:
+            raise KeyError(metric)
+        if item is None:
+            rows = self.order(metric, descending)
+        else:
+            # Only the rules of the item are sorted, by their precomputed
+            # position among all the rules
+            if self._item_rows is None:
+                self._item_rows = item_rows(self._rules)
+            rows = self._item_rows.get(item.strip(), np.empty(0, np.int64))
+            rank = self.rank(metric, descending)
+            rows = rows[np.argsort(rank[rows], kind='stable')]
+        return Page(
+            total=len(rows),
+            rules=self.records(rows[offset:offset + limit])
+        )
+
+    def records(self, rows: np.ndarray) -> List[dict]:
+        """ JSON ready dicts of rules, with missing and infinite values
+            as None
+        """
+        records = []
+        for row in rows.tolist():
+            record = {
+                name: sorted(map(str, self._itemsets[name][row]))
+                for name in ITEMSET_COLUMNS
+            }
+            for name in self.metrics:
+                value = self._values[name][row]
+                record[name] = float(value) if np.isfinite(value) else None
+            records.append(record)
+        return records
@@ -0,0 +1,97 @@
+// Loads the rules of a result a page at a time from a rules endpoint,
+// which returns JSON pages sorted and filtered on the server.
+// The page sets rules_url and rules_sort before loading this script.
+
+const rulesQuery = {page: 1, per_page: 50, sort: rules_sort, order: 'desc', item: ''};
+
+function formatCell(value) {
+    if (value === null) {
+        return '';
+    }
+    if (Array.isArray(value)) {
+        return value.join(', ');
+    }
+    return Number.isInteger(value) ? value : value.toFixed(4);
+}
+
+function renderSortOptions(metrics) {
+    const select = document.getElementById('rules_sort');
+    if (select.options.length) {
+        return;
+    }
+    for (const metric of metrics) {
+        const option = document.createElement('option');
+        option.value = metric;
+        option.textContent = metric;
+        option.selected = metric == rulesQuery.sort;
+        select.appendChild(option);
+    }
+}
+
+function renderRules(result) {
+    const columns = ['antecedents', 'consequents'].concat(result.metrics);
+    const head = document.getElementById('rules_head');
+    const body = document.getElementById('rules_body');
+    head.replaceChildren();
+    body.replaceChildren();
+
+    const header = document.createElement('tr');
+    for (const column of columns) {
+        const cell = document.createElement('th');
+        cell.textContent = column;
+        header.appendChild(cell);
+    }
+    head.appendChild(header);
+
+    for (const rule of result.rules) {
+        const row = document.createElement('tr');
+        for (const column of columns) {
+            const cell = document.createElement('td');
+            cell.textContent = formatCell(rule[column]);
+            row.appendChild(cell);
+        }
+        body.appendChild(row);
+    }
+
+    const pages = Math.max(1, Math.ceil(result.total / result.per_page));
+    document.getElementById('rules_position').textContent =
+        `Page ${result.page} of ${pages} (${result.total} rules)`;
+    document.getElementById('rules_previous').disabled = result.page <= 1;
+    document.getElementById('rules_next').disabled = result.page >= pages;
+    renderSortOptions(result.metrics);
+}
+
+function loadRules() {
+    const query = new URLSearchParams(rulesQuery);
+    fetch(`${rules_url}?${query}`)
+        .then(response => response.json())
+        .then(renderRules);
+}
+
+window.addEventListener('load', () => {
+    document.getElementById('rules_previous').addEventListener('click', () => {
+        rulesQuery.page -= 1;
+        loadRules();
+    });
+    document.getElementById('rules_next').addEventListener('click', () => {
+        rulesQuery.page += 1;
+        loadRules();
+    });
+    document.getElementById('rules_sort').addEventListener('change', event => {
+        rulesQuery.sort = event.target.value;
+        rulesQuery.page = 1;
+        loadRules();
+    });
+    document.getElementById('rules_order').addEventListener('change', event => {
+        rulesQuery.order = event.target.value;
+        rulesQuery.page = 1;
+        loadRules();
+    });
+    document.getElementById('rules_filter').addEventListener('submit', event => {
+        event.preventDefault();
+        rulesQuery.item = document.getElementById('rules_item').value.trim();
+        rulesQuery.page = 1;
+        loadRules();
+    });
+    loadRules();
+});
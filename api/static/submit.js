@@ -21,6 +21,52 @@ function post(path, params, method='post') {
     form.submit();
 }
 
+function showJobError(message) {
+    document.getElementsByClassName('spinner-grow')[0].style.display = 'none';
+    document.getElementsByClassName('job_stage')[0].textContent = message;
+    showDiv('job_stage');
+}
+
+// The JSON of a response, or an error with its text when it failed
+function responseJson(response) {
+    if (!response.ok) {
+        return response.text().then(text => {
+            throw new Error(text || `${response.status} ${response.statusText}`);
+        });
+    }
+    return response.json();
+}
+
+function submitJob(resultPath) {
+    const body = new FormData();
+    body.append('dataset_id', dataset_id);
+    body.append('metric', document.getElementById('metric').value);
+
+    fetch(submit_job, {method: 'POST', body: body})
+        .then(responseJson)
+        .then(job => pollJob(job.job_id, resultPath.replace('JOB_ID', job.job_id)))
+        .catch(error => showJobError(error.message));
+}
+
+function pollJob(jobId, resultUrl) {
+    const stage = document.getElementsByClassName('job_stage')[0];
+    showDiv('job_stage');
+
+    fetch(job_status.replace('JOB_ID', jobId))
+        .then(responseJson)
+        .then(status => {
+            if (status.state == 'SUCCESS') {
+                location.assign(resultUrl);
+            } else if (status.state == 'FAILURE') {
+                showJobError(status.error || 'The job failed.');
+            } else {
+                stage.textContent = status.stage ? `${status.stage}...` : 'queued...';
+                setTimeout(() => pollJob(jobId, resultUrl), 1000);
+            }
+        })
+        .catch(error => showJobError(error.message));
+}
+
 window.addEventListener('load', () => {
     if (location.pathname.includes('completed')) {
 
@@ -33,26 +79,17 @@ window.addEventListener('load', () => {
 
         document.getElementById('btn_table').addEventListener('click', () => {
             showDiv('spinner-grow');
-            post(
-                display_association_rules, 
-                {'metric': document.getElementById('metric').value}
-            );
+            submitJob(display_association_rules);
         });
 
         document.getElementById('btn_heatmap').addEventListener('click', () => {
             showDiv('spinner-grow');
-            post(
-                plot_heatmap,
-                {'metric' : document.getElementById('metric').value}
-            );
+            submitJob(plot_heatmap);
         });
         
         document.getElementById('btn_graph').addEventListener('click', () => {
             showDiv('spinner-grow');
-            post(
-                plot_network_graph,
-                {'metric': document.getElementById('metric').value}
-            );
+            submitJob(plot_network_graph);
         });
     } else if (location.pathname == '/') {
         document.getElementById('btn_demo').addEventListener('click', () => {
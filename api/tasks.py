@@ -6,14 +6,305 @@ sys.path.append(os.pardir)
 path = dirname(dirname(abspath(__file__)))
 sys.path.append(join(path, 'model'))
 
-import pandas as pd
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from model.apriori import rules_from_user_upload
-from . import celery
+from celery import chord
+from flask import current_app
+
+from model.apriori import MIN_SUPPORT, MINING_BUDGET, THRESHOLDS, \
+    TUNE_MIN_SUPPORT, MiningState, Rules, filter_rules, \
+    partition_candidates, partition_counts, prepare_data, \
+    rules_from_appended_upload, rules_from_partition_counts, \
+    rules_from_user_upload
+from . import cache, celery, db, loader, metrics, payload
+from .models import Dataset
+
+
+@celery.task(bind=True)
+def _rules_from_user_upload(self, dataset_id: str, metric: str) -> dict:
+    meta = {}
+    timer = metrics.StageTimer()
+
+    def progress(stage: str, **details) -> None:
+        # Details such as the preflight estimate stay in later stages
+        timer.start(stage)
+        meta.update(details, stage=stage)
+        self.update_state(state='PROGRESS', meta=meta)
+
+    progress('loading')
+    data = None
+    if current_app.config['INCREMENTAL_MINING']:
+        rules = incremental_rules(dataset_id, progress)
+    else:
+        partitions = current_app.config['MINING_PARTITIONS']
+        if partitions > 1 and (TUNE_MIN_SUPPORT or MINING_BUDGET):
+            # Tuning the support and the budgets need every transaction
+            current_app.logger.warning(
+                'Mining dataset %s without partitions, as '
+                'TUNE_MIN_SUPPORT or a mining budget is set', dataset_id)
+            partitions = 1
+        bounds = None
+        if partitions > 1:
+            bounds = loader.invoice_bounds(db.engine, dataset_id, partitions)
+        if bounds is not None and len(bounds) > 2:
+            # The chord callback stores its result under this task's id
+            progress('partitions')
+            timer.stop()
+            return self.replace(chord(
+                (_mine_partition.s(dataset_id, first, end)
+                 for first, end in zip(bounds[:-1], bounds[1:])),
+                _merge_candidates.s(dataset_id, metric, bounds)
+            ))
+        df = loader.read_transactions(db.engine, dataset_id)
+        rules, data = cached_rules(df, progress)
+    progress('publishing')
+    publish_rules(dataset_id, rules, data)
+    progress('serializing')
+    result = job_result(dataset_id, metric, rules)
+    result['profile'] = metrics.observe_job(
+        timer.stop(),
+        rules.engine,
+        invoices=meta.get('invoices'),
+        items=meta.get('items'),
+        itemsets=meta.get('itemsets'),
+        rules=count_rules(rules)
+    )
+    return result
+
+
+@celery.task
+def _mine_partition(
+        dataset_id: str,
+        first: Optional[str],
+        end: Optional[str]) -> List[List[str]]:
+    """ Locally frequent itemsets of a range of invoices """
+    with metrics.timed('partition_mining'):
+        df = loader.read_transactions(
+            db.engine, dataset_id, invoices=(first, end))
+        return partition_candidates(df)
+
+
+@celery.task(bind=True)
+def _merge_candidates(
+        self,
+        partitions: List[List[List[str]]],
+        dataset_id: str,
+        metric: str,
+        bounds: List[Optional[str]]) -> dict:
+    """ Count the union of the candidates of every partition in every
+        partition
+    """
+    self.update_state(state='PROGRESS', meta={'stage': 'counting'})
+    candidates = [
+        list(itemset) for itemset in
+        sorted({tuple(itemset) for found in partitions for itemset in found})
+    ]
+    return self.replace(chord(
+        (_count_partition.s(dataset_id, first, end, candidates)
+         for first, end in zip(bounds[:-1], bounds[1:])),
+        _merge_counts.s(dataset_id, metric, candidates)
+    ))
 
 
 @celery.task
-def _rules_from_user_upload(df_json: str, metric: str) -> str:
-    df = pd.read_json(df_json)
-    rules = rules_from_user_upload(df)
-    return rules._asdict()[metric].to_json()
+def _count_partition(
+        dataset_id: str,
+        first: Optional[str],
+        end: Optional[str],
+        candidates: List[List[str]]) -> dict:
+    """ Transaction counts of the candidates in a range of invoices """
+    with metrics.timed('partition_counting'):
+        df = loader.read_transactions(
+            db.engine, dataset_id, invoices=(first, end))
+        counts, n_transactions, items = partition_counts(df, candidates)
+    return {'counts': counts, 'n_transactions': n_transactions,
+            'items': items}
+
+
+@celery.task(bind=True)
+def _merge_counts(
+        self,
+        partitions: List[dict],
+        dataset_id: str,
+        metric: str,
+        candidates: List[List[str]]) -> dict:
+    """ Rules from the candidate counts of every partition """
+    meta = {}
+    timer = metrics.StageTimer()
+
+    def progress(stage: str, **details) -> None:
+        timer.start(stage)
+        meta.update(details, stage=stage)
+        self.update_state(state='PROGRESS', meta=meta)
+
+    progress('rules')
+    counts = [
+        sum(partition_counts) for partition_counts in
+        zip(*(partition['counts'] for partition in partitions))
+    ]
+    n_transactions = sum(
+        partition['n_transactions'] for partition in partitions)
+    items = set().union(*(partition['items'] for partition in partitions))
+    rules = rules_from_partition_counts(
+        candidates, counts, n_transactions, progress=progress)
+    progress('publishing')
+    publish_rules(dataset_id, rules)
+    progress('serializing')
+    result = job_result(dataset_id, metric, rules)
+    result['profile'] = metrics.observe_job(
+        timer.stop(),
+        rules.engine,
+        invoices=n_transactions,
+        items=len(items),
+        itemsets=meta.get('itemsets'),
+        rules=count_rules(rules)
+    )
+    return result
+
+
+@celery.task
+def _cleanup_datasets() -> int:
+    """ Delete datasets inactive for DATASET_RETENTION_HOURS """
+    cutoff = datetime.utcnow() - timedelta(
+        hours=current_app.config['DATASET_RETENTION_HOURS'])
+    expired = [
+        dataset.id for dataset in
+        Dataset.query.filter(Dataset.last_active < cutoff)
+    ]
+    if expired:
+        loader.delete_datasets(db.engine, expired)
+    return len(expired)
+
+
+def job_result(dataset_id: str, metric: str, rules: Rules) -> dict:
+    """ The result of a rules job as read by api.job_rules """
+    return {
+        'dataset_id': dataset_id,
+        'metric': metric,
+        'engine': rules.engine,
+        'rules': payload.encode_rules(rules._asdict()[metric])
+    }
+
+
+def count_rules(rules: Rules) -> int:
+    """ The number of rules with every metric """
+    if rules.table is not None:
+        return len(rules.table)
+    return max(len(rules.confidence), len(rules.lift), len(rules.leverage))
+
+
+def publish_rules(
+        dataset_id: str,
+        rules: Rules,
+        data: Optional[bytes] = None) -> bool:
+    """ Store the rules of a dataset with every metric for the
+        recommendation indexes of the web processes. Rules equal to the
+        stored ones keep their version, so that the web processes do not
+        index them again.
+
+    Args:
+        dataset_id (str): The dataset the rules were computed from
+        rules (Rules): The rules
+        data (bytes, optional): rules.table already serialized by
+            payload.rules_to_arrow. Defaults to None.
+
+    Returns:
+        bool: Whether the stored rules changed.
+    """
+    if rules.table is None:
+        return False
+    if data is None:
+        data = payload.rules_to_arrow(rules.table)
+    changed = Dataset.query.filter(
+        Dataset.id == dataset_id,
+        db.or_(Dataset.rules.is_(None), Dataset.rules != data)
+    ).update({
+        Dataset.rules: data,
+        Dataset.rules_version: db.func.coalesce(Dataset.rules_version, 0) + 1
+    }, synchronize_session=False)
+    Dataset.query.filter_by(id=dataset_id).update(
+        {Dataset.last_active: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return bool(changed)
+
+
+def cached_rules(df, progress) -> Tuple[Rules, bytes]:
+    """ Rules of the transactions from the rule cache, mining and caching
+        them on a miss, and their table as stored in the cache
+    """
+    progress('cache')
+    rule_cache = cache.get_rule_cache()
+    key = rule_cache.key(
+        cache.fingerprint(df),
+        min_support=None if TUNE_MIN_SUPPORT else MIN_SUPPORT,
+        **MINING_BUDGET,
+        **THRESHOLDS
+    )
+    data = rule_cache.get(key)
+    if data is not None:
+        # The shape of the dataset, as mining it would report
+        prepared = prepare_data(df)
+        progress(
+            'rules',
+            invoices=prepared['InvoiceNo'].nunique(),
+            items=prepared['Description'].nunique(),
+            itemsets=payload.arrow_itemsets(data)
+        )
+        rules = filter_rules(
+            payload.rules_from_arrow(data),
+            engine='cache',
+            **THRESHOLDS
+        )
+        return rules, data
+    details = {}
+
+    def mining_progress(stage: str, **stage_details) -> None:
+        # Keeps the itemset count to store with the rules
+        details.update(stage_details)
+        progress(stage, **stage_details)
+
+    rules = rules_from_user_upload(df, progress=mining_progress)
+    data = payload.rules_to_arrow(
+        rules.table, itemsets=details.get('itemsets'))
+    rule_cache.put(key, data)
+    return rules, data
+
+
+def incremental_rules(dataset_id: str, progress) -> Rules:
+    """ Rules of a dataset from the mining state of its previous run and
+        the rows appended since, saving the new state. Every row is mined
+        again when some were appended to earlier invoices. The rules are
+        mined with MIN_SUPPORT and are not cached, see
+        rules_from_appended_upload.
+    """
+    dataset = Dataset.query.get(dataset_id)
+    last_id = loader.last_row_id(db.engine, dataset_id)
+    state = None
+    if dataset.mining_state is not None:
+        state = MiningState.from_json(dataset.mining_state)
+    if state is not None and loader.appends_to_invoices(
+            db.engine, dataset_id, dataset.mined_row_id, last_id):
+        # Rows of invoices that were already mined change their baskets,
+        # which the counts of the state cannot follow
+        state = None
+    df = loader.read_transactions(
+        db.engine,
+        dataset_id,
+        after_id=dataset.mined_row_id if state is not None else None,
+        until_id=last_id
+    )
+    rules, state = rules_from_appended_upload(
+        df,
+        state,
+        lambda: loader.read_transactions(
+            db.engine, dataset_id, until_id=last_id),
+        progress=progress
+    )
+    dataset.mining_state = state.to_json()
+    dataset.mined_row_id = last_id
+    dataset.last_active = datetime.utcnow()
+    db.session.commit()
+    return rules
@@ -0,0 +1,3 @@
+""" Benchmarks of the rule mining and plotting pipeline on synthetic
+    transactions, see python -m benchmarks --help
+"""
@@ -0,0 +1,78 @@
+""" Run the benchmarks and compare results with a baseline
+
+    python -m benchmarks run --scale small medium --output results.json
+    python -m benchmarks run --baseline baseline.json
+    python -m benchmarks compare results.json baseline.json
+"""
+import argparse
+import json
+import sys
+from typing import List
+
+from benchmarks.suite import BENCHMARKS, MEMORY_TOLERANCE, SCALES, \
+    TIME_TOLERANCE, compare, run
+
+
+def report(comparisons: List[dict]) -> bool:
+    """ Print the comparisons, returning whether any is a regression """
+    for comparison in comparisons:
+        flag = 'REGRESSION' if comparison['regression'] else 'ok'
+        print(f'{comparison["benchmark"]:<28} {comparison["scale"]:<7}'
+              f'{comparison["time_ratio"]:>8.2f}x time'
+              f'{comparison["memory_ratio"]:>8.2f}x memory  {flag}')
+    return any(comparison['regression'] for comparison in comparisons)
+
+
+def read(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '--scale', nargs='+', choices=list(SCALES),
+        default=['small', 'medium'])
+    run_parser.add_argument(
+        '--only', nargs='+', choices=[b.name for b in BENCHMARKS])
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help='JSON file of the results')
+    run_parser.add_argument('--baseline', help='JSON file to compare with')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare results with a baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline')
+
+    for command in (run_parser, compare_parser):
+        command.add_argument(
+            '--time-tolerance', type=float, default=TIME_TOLERANCE)
+        command.add_argument(
+            '--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.scale, args.only, args.repeat, args.seed)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        if not args.baseline:
+            return 0
+        baseline = read(args.baseline)
+    else:
+        results, baseline = read(args.results), read(args.baseline)
+    regressed = report(compare(
+        results,
+        baseline,
+        args.time_tolerance,
+        args.memory_tolerance
+    ))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,144 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def item_names(n_items: int) -> List[str]:
+    width = len(str(n_items - 1))
+    return [f'ITEM {i:0{width}d}' for i in range(n_items)]
+
+
+def quest_patterns(
+        rng: np.random.Generator,
+        popularity: np.ndarray,
+        n_patterns: int,
+        pattern_length: float,
+        correlation: float) -> List[np.ndarray]:
+    """ The potentially frequent itemsets of the IBM Quest generator. Each
+        pattern takes an exponentially distributed fraction of its items
+        from the previous pattern and draws the rest by item popularity.
+    """
+    n_items = len(popularity)
+    patterns = []
+    previous = np.empty(0, dtype=np.int64)
+    for _ in range(n_patterns):
+        size = int(np.clip(rng.poisson(pattern_length), 1, n_items))
+        shared = min(
+            len(previous),
+            int(round(min(1., rng.exponential(correlation)) * size))
+        )
+        items = set(rng.choice(previous, shared, replace=False).tolist())
+        while len(items) < size:
+            items.update(rng.choice(
+                n_items, size - len(items), p=popularity).tolist())
+        previous = np.array(sorted(items), dtype=np.int64)
+        patterns.append(previous)
+    return patterns
+
+
+def quest_transactions(
+        n_invoices: int = 10_000,
+        n_items: int = 1_000,
+        basket_length: float = 10,
+        pattern_length: float = 4,
+        n_patterns: Optional[int] = None,
+        skew: float = 1.,
+        correlation: float = 0.5,
+        corruption: float = 0.5,
+        credit_fraction: float = 0.01,
+        seed: int = 0) -> pd.DataFrame:
+    """ Synthetic transactions in the style of the IBM Quest generator
+        (Agrawal and Srikant, 1994), in the format of uploads
+
+    Baskets are filled with patterns, potentially frequent itemsets picked
+    by exponentially distributed weights. Each time a pattern is used,
+    items are dropped from it while a uniform draw is below its
+    corruption level, normally distributed around corruption. A pattern
+    that does not fit a basket is added anyway half of the time.
+
+    Args:
+        n_invoices (int, optional): The number of baskets.
+            Defaults to 10_000.
+        n_items (int, optional): The size of the catalog. Defaults to 1_000.
+        basket_length (float, optional): The mean number of items of a
+            basket, Poisson distributed. Defaults to 10.
+        pattern_length (float, optional): The mean number of items of a
+            pattern, Poisson distributed. Defaults to 4.
+        n_patterns (int, optional): The number of patterns. Defaults to
+            twice n_items, as in the Quest paper.
+        skew (float, optional): The exponent of the Zipf distribution of
+            item popularity, 0 for uniform. Defaults to 1.
+        correlation (float, optional): The mean fraction of items a
+            pattern shares with the previous one. Defaults to 0.5.
+        corruption (float, optional): The mean corruption level of the
+            patterns. Defaults to 0.5.
+        credit_fraction (float, optional): The fraction of invoices that
+            are credits, which prepare_data drops. Defaults to 0.01.
+        seed (int, optional): The seed of the random generator.
+            Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Rows with the columns InvoiceNo, StockCode,
+            Description, Quantity, and Country.
+    """
+    if n_patterns is None:
+        n_patterns = 2 * n_items
+    rng = np.random.default_rng(seed)
+    popularity = 1. / np.arange(1, n_items + 1) ** skew
+    popularity /= popularity.sum()
+    patterns = quest_patterns(
+        rng, popularity, n_patterns, pattern_length, correlation)
+    weights = rng.exponential(1., n_patterns)
+    weights /= weights.sum()
+    corruptions = np.clip(rng.normal(corruption, 0.1, n_patterns), 0., 0.99)
+
+    sizes = np.maximum(rng.poisson(basket_length, n_invoices), 1)
+    # Patterns picked, items dropped from them, and coin flips, drawn in
+    # blocks rather than one at a time
+    cumulative = np.cumsum(weights)
+    block = max(1024, int(sizes.sum() / max(pattern_length, 1.)))
+    picks = dropped = flips = None
+    position = block
+
+    invoices, items = [], []
+    for invoice, size in enumerate(sizes.tolist()):
+        basket = set()
+        while len(basket) < size:
+            if position == block:
+                picks = np.minimum(
+                    np.searchsorted(cumulative, rng.random(block)),
+                    n_patterns - 1)
+                dropped = (rng.geometric(1. - corruptions[picks]) - 1)\
+                    .tolist()
+                flips = (rng.random(block) < 0.5).tolist()
+                picks = picks.tolist()
+                position = 0
+            kept = patterns[picks[position]]
+            if dropped[position]:
+                kept = rng.permutation(kept)[
+                    :max(len(kept) - dropped[position], 0)]
+            flip = flips[position]
+            position += 1
+            if basket and len(basket) + len(kept) > size and flip:
+                break
+            basket.update(kept.tolist())
+        invoices.extend([invoice] * len(basket))
+        items.extend(basket)
+
+    invoices = np.array(invoices, dtype=np.int64)
+    credits = rng.random(n_invoices) < credit_fraction
+    invoice_numbers = np.char.add(
+        np.where(credits, 'C', ''),
+        (500_000 + np.arange(n_invoices)).astype(str)
+    )
+    quantities = rng.integers(1, 13, len(invoices))
+    quantities[credits[invoices]] *= -1
+    names = np.array(item_names(n_items), dtype=object)
+    return pd.DataFrame({
+        'InvoiceNo': invoice_numbers[invoices],
+        'StockCode': np.array(items, dtype=np.int64) + 10_000,
+        'Description': names[items],
+        'Quantity': quantities,
+        'Country': 'United Kingdom'
+    })
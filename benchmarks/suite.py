@@ -0,0 +1,239 @@
+import gc
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import cached_property
+from os.path import abspath, dirname, join
+from typing import Callable, Dict, Iterable, List, Optional
+
+sys.path.append(join(dirname(dirname(abspath(__file__))), 'model'))
+
+import numpy as np
+import pandas as pd
+
+import apriori
+import visualize
+from benchmarks.generator import quest_transactions
+
+Scale = namedtuple('Scale', ['invoices', 'items', 'min_support'])
+
+SCALES = {
+    'small': Scale(invoices=1_000, items=100, min_support=0.05),
+    'medium': Scale(invoices=10_000, items=1_000, min_support=0.01),
+    'large': Scale(invoices=100_000, items=5_000, min_support=0.005)
+}
+
+# A benchmark runs on the inputs returned by setup, which is not timed
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'run'])
+
+# Slowdowns and memory growth over the baseline flagged as regressions
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+
+
+class Inputs:
+    """ The inputs of every stage of the pipeline at one scale, each built
+        on first use from the output of the stage before
+    """
+    def __init__(self, scale: Scale, seed: int = 0):
+        self.scale = scale
+        self.seed = seed
+
+    @cached_property
+    def transactions(self) -> pd.DataFrame:
+        return quest_transactions(
+            n_invoices=self.scale.invoices,
+            n_items=self.scale.items,
+            seed=self.seed
+        )
+
+    @cached_property
+    def prepared(self) -> pd.DataFrame:
+        return apriori.prepare_data(self.transactions)
+
+    @cached_property
+    def one_hot(self) -> pd.DataFrame:
+        return apriori.count_items_per_transaction(self.prepared)
+
+    @cached_property
+    def rules(self) -> apriori.Rules:
+        return apriori.make_rules(
+            self.one_hot, min_support=self.scale.min_support)
+
+
+def uncached_network(inputs: Inputs) -> tuple:
+    # Layouts are cached per rule set, which would time the cache
+    visualize.network_layout.cache_clear()
+    return inputs.rules.lift, 'lift'
+
+
+BENCHMARKS = [
+    Benchmark(
+        'prepare_data',
+        lambda inputs: (inputs.transactions,),
+        apriori.prepare_data
+    ),
+    Benchmark(
+        'count_items_per_transaction',
+        lambda inputs: (inputs.prepared,),
+        apriori.count_items_per_transaction
+    ),
+    Benchmark(
+        'make_rules',
+        lambda inputs: (inputs.one_hot, inputs.scale.min_support),
+        apriori.make_rules
+    ),
+    Benchmark(
+        'remove_frozensets',
+        lambda inputs: (inputs.rules.table,),
+        visualize.remove_frozensets
+    ),
+    Benchmark(
+        'plot_heatmap_plotly',
+        lambda inputs: (inputs.rules.lift, 'lift', False),
+        visualize.plot_heatmap_plotly
+    ),
+    Benchmark(
+        'plot_network_graph_plotly',
+        lambda inputs: uncached_network(inputs) + (False,),
+        visualize.plot_network_graph_plotly
+    )
+]
+
+
+def measure(benchmark: Benchmark, inputs: Inputs, repeat: int) -> dict:
+    """ Time a benchmark repeat times, then trace its peak memory in one
+        more run, as tracing slows it down
+
+    Returns:
+        dict: The best and median seconds, and the peak bytes allocated
+            above what was allocated before the run.
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = benchmark.setup(inputs)
+        gc.collect()
+        start = time.perf_counter()
+        benchmark.run(*args)
+        seconds.append(time.perf_counter() - start)
+
+    args = benchmark.setup(inputs)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'best_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'peak_bytes': peak
+    }
+
+
+def run(
+        scales: Iterable[str] = ('small', 'medium'),
+        names: Optional[Iterable[str]] = None,
+        repeat: int = 3,
+        seed: int = 0,
+        log: Callable[[str], None] = print) -> dict:
+    """ Run the benchmarks at several scales
+
+    Args:
+        scales (Iterable[str], optional): Keys of SCALES.
+            Defaults to ('small', 'medium').
+        names (Iterable[str], optional): The benchmarks run.
+            Defaults to every benchmark.
+        repeat (int, optional): Timed runs of each benchmark. Defaults to 3.
+        seed (int, optional): The seed of the transactions.
+            Defaults to 0.
+        log (Callable[[str], None], optional): Called with a line per
+            result. Defaults to print.
+
+    Returns:
+        dict: The environment under meta and a result per benchmark and
+            scale under results.
+    """
+    names = set(names or (benchmark.name for benchmark in BENCHMARKS))
+    unknown = names - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        raise ValueError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+    results = []
+    for scale_name in scales:
+        inputs = Inputs(SCALES[scale_name], seed)
+        for benchmark in BENCHMARKS:
+            if benchmark.name not in names:
+                continue
+            result = {
+                'benchmark': benchmark.name,
+                'scale': scale_name,
+                **SCALES[scale_name]._asdict(),
+                'repeat': repeat,
+                **measure(benchmark, inputs, repeat)
+            }
+            results.append(result)
+            log(f'{benchmark.name:<28} {scale_name:<7}'
+                f'{result["best_seconds"]:>10.3f} s'
+                f'{result["peak_bytes"] / 2 ** 20:>10.1f} MB')
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare(
+        current: dict,
+        baseline: dict,
+        time_tolerance: float = TIME_TOLERANCE,
+        memory_tolerance: float = MEMORY_TOLERANCE) -> List[dict]:
+    """ Compare results with a baseline of the same benchmarks
+
+    Args:
+        current (dict): The output of run
+        baseline (dict): An earlier output of run
+        time_tolerance (float, optional): The fraction by which the best
+            time may exceed the baseline. Defaults to TIME_TOLERANCE.
+        memory_tolerance (float, optional): The fraction by which the peak
+            memory may exceed the baseline. Defaults to MEMORY_TOLERANCE.
+
+    Returns:
+        List[dict]: For every benchmark and scale in both, the ratios of
+            time and memory to the baseline and whether either is a
+            regression.
+    """
+    def by_key(results: dict) -> Dict[tuple, dict]:
+        return {
+            (result['benchmark'], result['scale']): result
+            for result in results['results']
+        }
+
+    before = by_key(baseline)
+    comparisons = []
+    for key, result in by_key(current).items():
+        if key not in before:
+            continue
+        time_ratio = result['best_seconds'] / max(
+            before[key]['best_seconds'], 1e-9)
+        memory_ratio = result['peak_bytes'] / max(
+            before[key]['peak_bytes'], 1)
+        comparisons.append({
+            'benchmark': key[0],
+            'scale': key[1],
+            'time_ratio': time_ratio,
+            'memory_ratio': memory_ratio,
+            'regression': time_ratio > 1 + time_tolerance
+            or memory_ratio > 1 + memory_tolerance
+        })
+    return comparisons
@@ -1,5 +1,25 @@
+import gc
 import os
-from api import celery, create_app
+from celery.signals import worker_init, worker_process_init
 
-app = create_app()
+from api import celery, create_app, db, metrics
+
+app = create_app(web=False)
 app.app_context().push()
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    # The main process of the worker serves the metrics of its pool
+    metrics.clear_multiprocess_dir()
+    if app.config['WORKER_METRICS_PORT']:
+        metrics.serve(app.config['WORKER_METRICS_PORT'])
+    # Objects loaded before the pool forks are never collected, so that
+    # the collector does not copy their pages into every pool process
+    gc.freeze()
+
+
+@worker_process_init.connect
+def close_connections(**kwargs):
+    # Pool processes must not share the connections of the main process
+    db.engine.dispose()
@@ -27,6 +27,42 @@ class Config:
     )
     CELERY_BROKER_URL = environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    # A redis:// URL or a directory shared by the web process and workers
+    RULE_CACHE_URL = environ.get('RULE_CACHE_URL', CELERY_BROKER_URL)
+    RULE_CACHE_MAX_BYTES = int(environ.get(
+        'RULE_CACHE_MAX_BYTES', 512 * 1024 * 1024
+    ))
+    RULE_CACHE_TTL = int(environ.get('RULE_CACHE_TTL', 24 * 60 * 60))
+    DATASET_RETENTION_HOURS = int(environ.get('DATASET_RETENTION_HOURS', 24))
+    # Update the counts of the previous run when rows were appended to a
+    # dataset instead of mining all of its rows again. Incremental jobs
+    # mine with MIN_SUPPORT, without TUNE_MIN_SUPPORT, MINING_BUDGET, or
+    # the rule cache, and mine every row again when rows were appended to
+    # earlier invoices.
+    INCREMENTAL_MINING = environ.get(
+        'INCREMENTAL_MINING', 'false'
+    ).lower() == 'true'
+    # Split the rules task of each upload into this many invoice ranges
+    # mined by separate tasks, so that one job can use several workers.
+    # Uploads are not split when TUNE_MIN_SUPPORT or a mining budget is
+    # set, and JOB_MEMORY_BYTES applies to each range.
+    MINING_PARTITIONS = int(environ.get('MINING_PARTITIONS', 1))
+    # Seconds a web process serves recommendations from its index of a
+    # dataset's rules before checking whether they were recomputed, and
+    # the number of datasets it keeps indexed
+    RECOMMEND_REFRESH_SECONDS = int(environ.get(
+        'RECOMMEND_REFRESH_SECONDS', 5
+    ))
+    RECOMMEND_INDEXES = int(environ.get('RECOMMEND_INDEXES', 32))
+    # Port on which Celery workers serve their Prometheus metrics, 0 for
+    # none. The web processes serve theirs on /metrics.
+    WORKER_METRICS_PORT = int(environ.get('WORKER_METRICS_PORT', 0))
+    CELERYBEAT_SCHEDULE = {
+        'cleanup-datasets': {
+            'task': 'api.tasks._cleanup_datasets',
+            'schedule': 60 * 60
+        }
+    }
 
 
 class ProdConfig(Config):
@@ -0,0 +1,34 @@
+""" Gunicorn settings, read from the working directory of gunicorn.
+
+The app is loaded once by the master process before it forks the workers,
+so that they share the demo rules, their plots, and the compiled templates
+copy-on-write instead of each building their own. Set
+GUNICORN_PRELOAD=false to load the app in every worker instead.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    from api import metrics
+
+    metrics.clear_multiprocess_dir()
+
+
+def when_ready(server):
+    # Objects loaded before the workers fork are never collected, so that
+    # the collector does not copy their pages into every worker
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Workers must not share the connections of the master process
+        from wsgi import app
+        from api import db
+
+        with app.app_context():
+            db.engine.dispose()
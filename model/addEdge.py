@@ -8,6 +8,8 @@ Created on Fri May 15 11:45:07 2020
 import math
 from typing import Tuple
 
+import numpy as np
+
 
 def addEdge(start: tuple, end: tuple, edge_x: list, edge_y: list,
             lengthFrac: float = 1, arrowPos: str = None,
@@ -100,3 +102,70 @@ def addEdge(start: tuple, end: tuple, edge_x: list, edge_y: list,
         edge_y.append(None)
 
     return edge_x, edge_y
+
+
+def add_edges(starts: np.ndarray, ends: np.ndarray,
+              lengthFrac: float = 1, arrowPos: str = None,
+              arrowLength: float = 0.025, arrowAngle: int = 30,
+              dotSize: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+    """ Create the edges with arrows between many pairs of nodes at once.
+        The coordinates are the same as calling addEdge for every pair.
+
+    Args:
+        starts (np.ndarray): starting points, an array of shape (n, 2)
+        ends (np.ndarray): end points, an array of shape (n, 2)
+        lengthFrac (float, optional): length of edge as fraction of distance
+            between nodes. Defaults to 1.
+        arrowPos (str, optional): where the arrow appears on the edge.
+            Can be None, 'middle', or 'end'. Defaults to None.
+        arrowLength (float, optional): the length of the arrow head.
+            Defaults to 0.025.
+        arrowAngle (int, optional): The angle the arrow makes with the edge.
+            Defaults to 30.
+        dotSize (int, optional): plotly scatter dot size you are using.
+            Defaults to 20.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: arrays of x and y coordinates with
+            NaN between the lines of each edge and arrowhead.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    x0, y0 = starts[:, 0], starts[:, 1]
+    x1, y1 = ends[:, 0], ends[:, 1]
+
+    # Shorten every edge by the fraction covered by the dots
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length = np.hypot(x1 - x0, y1 - y0)
+        fracs = lengthFrac - dotSize * (.0565 / 20) / length
+    skipX = (x1 - x0) * (1 - fracs)
+    skipY = (y1 - y0) * (1 - fracs)
+    x0, x1 = x0 + skipX / 2, x1 - skipX / 2
+    y0, y1 = y0 + skipY / 2, y1 - skipY / 2
+
+    gap = np.full_like(x0, np.nan)
+    columns_x = [x0, x1, gap]
+    columns_y = [y0, y1, gap]
+
+    if arrowPos is not None:
+        pointx, pointy = x1, y1
+        if arrowPos == 'middle' or arrowPos == 'mid':
+            pointx = x0 + (x1 - x0) / 2
+            pointy = y0 + (y1 - y0) / 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eta = np.where(
+                y1 != y0,
+                np.degrees(np.arctan((x1 - x0) / (y1 - y0))),
+                90.0
+            )
+        signy = np.where(y1 != y0, np.sign(y1 - y0), 1.)
+
+        for angle in (eta + arrowAngle, eta - arrowAngle):
+            dx = arrowLength * np.sin(np.radians(angle))
+            dy = arrowLength * np.cos(np.radians(angle))
+            columns_x += [pointx, pointx - signy * dx, gap]
+            columns_y += [pointy, pointy - signy * dy, gap]
+
+    return np.column_stack(columns_x).ravel(), \
+        np.column_stack(columns_y).ravel()
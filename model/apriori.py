@@ -1,12 +1,27 @@
 import os
 from collections import namedtuple
+from itertools import combinations
+from typing import IO, Callable, Iterable, Iterator, List, Optional, \
+    Tuple, Union
 
+import numpy as np
 import pandas as pd
-
-from mlxtend.preprocessing import TransactionEncoder
-from mlxtend.frequent_patterns import fpgrowth, association_rules
-
-Rules = namedtuple('Rules', ['confidence', 'lift', 'leverage'])
+from pandas.api.types import union_categoricals
+from scipy import sparse
+
+from engines import choose_engine, get_engine
+from incremental import MiningState, build_state, update_state
+from parallel import count_candidates, effective_jobs, merge_partitions, \
+    parallel_itemsets
+from preflight import SAMPLE_INVOICES, Estimate, check_estimate, \
+    estimate_job
+from tuning import budget_counts, tune_min_support
+
+Rules = namedtuple(
+    'Rules',
+    ['confidence', 'lift', 'leverage', 'engine', 'table', 'min_support'],
+    defaults=(None, None, None)
+)
 
 FLASK_ENV = os.environ.get('FLASK_ENV', 'development')
 
@@ -15,20 +30,184 @@ if FLASK_ENV == 'development':
 else:
     MIN_SUPPORT = 0.03
 
-
-def read_input_data(file_name: str) -> pd.DataFrame:
-    """ Check whether data is .csv, .xls, or .xlsx extension.
+# Budget of the itemsets, rules, and bytes mined from each upload. Uploads
+# exceeding it fail with MiningBudgetExceeded. With TUNE_MIN_SUPPORT the
+# lowest support that fits the budget is used instead of MIN_SUPPORT.
+MINING_BUDGET = {
+    param: int(os.environ[variable]) for param, variable in [
+        ('max_itemsets', 'MINING_MAX_ITEMSETS'),
+        ('max_rules', 'MINING_MAX_RULES'),
+        ('max_bytes', 'MINING_MAX_BYTES')
+    ] if os.environ.get(variable)
+}
+TUNE_MIN_SUPPORT = os.environ.get('TUNE_MIN_SUPPORT', 'false').lower() \
+    == 'true'
+
+# Bytes of worker memory each upload may use. Uploads estimated to need
+# more are rejected with JobTooLarge before they are encoded.
+JOB_MEMORY_BYTES = int(os.environ.get('JOB_MEMORY_BYTES', 0)) or None
+
+# Processes mining each upload. 0 means one per CPU. The processes of
+# Celery's default prefork pool are daemonic and cannot start others, so
+# they mine serially; run the worker with --pool solo to mine each upload
+# with several processes. The threads pool does not work, as the app
+# context that tasks use is only pushed on the main thread of the worker.
+MINING_WORKERS = int(os.environ.get('MINING_WORKERS', 1))
+
+# Thresholds of the rules calculated from uploads
+THRESHOLDS = {'lift_thresh': 1, 'conf_thresh': 0.5, 'lev_thresh': 0.03}
+
+# Baskets with fewer invoice x item cells than this are returned as a
+# regular dense DataFrame by count_items_per_transaction.
+DENSE_CELL_LIMIT = 1_000_000
+
+# Columns read from uploads and the number of rows parsed at a time
+INPUT_COLUMNS = ['InvoiceNo', 'Description', 'Quantity']
+CHUNKSIZE = 100_000
+
+
+def read_input_data(
+        file_name: str,
+        file: Optional[IO] = None,
+        columns: Optional[List[str]] = None,
+        chunksize: int = CHUNKSIZE) -> pd.DataFrame:
+    """ Check whether data is .csv, .xls, or .xlsx extension and stream
+        the columns used by prepare_data in chunks. Rows without an
+        InvoiceNo and credits are dropped from each chunk as it is read,
+        so memory grows with the rows kept rather than the file size.
 
     Args:
         file_name (str): Name of data file upload.
+        file (IO, optional): File object to read instead of opening
+            file_name, such as the stream of an upload. Defaults to None.
+        columns (List[str], optional): Columns to read in addition to
+            InvoiceNo, Description, and Quantity. Defaults to None.
+        chunksize (int, optional): The number of rows parsed at a time.
+            Defaults to CHUNKSIZE.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the transaction data with
+            string InvoiceNos, categorical Descriptions, and int32
+            Quantities.
+    """
+    columns = INPUT_COLUMNS + [
+        column for column in columns or [] if column not in INPUT_COLUMNS
+    ]
+    source = file if file is not None else file_name
+    extension = os.path.splitext(file_name.lower())[1]
+    if extension == '.csv':
+        chunks = pd.read_csv(
+            source,
+            usecols=lambda column: column in columns,
+            dtype={'InvoiceNo': str, 'Description': str},
+            chunksize=chunksize
+        )
+    elif extension == '.xlsx':
+        chunks = read_xlsx_chunks(source, columns, chunksize)
+    elif extension == '.xls':
+        chunks = [pd.read_excel(
+            source,
+            usecols=lambda column: column in columns,
+            dtype={'InvoiceNo': str, 'Description': str}
+        )]
+    else:
+        raise ValueError(
+            f"Unsupported file type '{extension}'. Must be .csv, .xls,"
+            f" or .xlsx.")
+
+    frames = []
+    for chunk in chunks:
+        check_columns(chunk.columns, columns)
+        chunk = drop_credits(chunk)
+        frames.append(chunk.assign(
+            Description=chunk['Description'].astype('category'),
+            Quantity=chunk['Quantity'].fillna(0).astype(np.int32)
+        ))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    descriptions = union_categoricals(
+        [frame['Description'] for frame in frames]
+    )
+    df = pd.concat(
+        [frame.drop(columns='Description') for frame in frames],
+        ignore_index=True
+    )
+    df['Description'] = descriptions
+    return df[columns]
+
+
+def read_xlsx_chunks(
+        file: Union[str, IO],
+        columns: List[str],
+        chunksize: int = CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """ Read the first sheet of an .xlsx file row by row in read-only mode
+
+    Args:
+        file (Union[str, IO]): Path or file object of the workbook
+        columns (List[str]): Names of the header columns to keep
+        chunksize (int, optional): The number of rows in each DataFrame.
+            Defaults to CHUNKSIZE.
+
+    Yields:
+        Iterator[pd.DataFrame]: DataFrames of at most chunksize rows
+            with the kept columns.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        positions = [
+            (i, name) for i, name in enumerate(header) if name in columns
+        ]
+        names = [name for _, name in positions]
+        check_columns(names, columns)
+
+        batch = []
+        for row in rows:
+            batch.append(
+                [row[i] if i < len(row) else None for i, _ in positions]
+            )
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=names)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+
+def check_columns(found: Iterable[str], expected: List[str]) -> None:
+    """ Raise a ValueError naming the first expected column not found
+
+    Args:
+        found (Iterable[str]): The columns that were read
+        expected (List[str]): The columns that must be present
+    """
+    found = set(found)
+    for column in expected:
+        if column not in found:
+            raise ValueError(
+                f"Data is missing column '{column}'."
+                f"\nA .csv or excel file must be uploaded with"
+                f" the columns 'InvoiceNo', 'Description', and 'Quantity'.")
+
+
+def drop_credits(df: pd.DataFrame) -> pd.DataFrame:
+    """ Drop rows without an InvoiceNo and credit invoices, which
+        contain a 'C'
+
+    Args:
+        df (pd.DataFrame): DataFrame with an InvoiceNo column
 
     Returns:
-        pd.DataFrame: A DataFrame containing the transaction data.
+        pd.DataFrame: A DataFrame with string InvoiceNos.
     """
-    if file_name.lower().endswith('.csv'):
-        return pd.read_csv(file_name)
-    elif file_name.lower().endswith(('.xls', '.xlsx')):
-        return pd.read_excel(file_name)
+    df = df.dropna(axis=0, subset=['InvoiceNo'])
+    df = df.assign(InvoiceNo=df['InvoiceNo'].astype(str))
+    return df[~df['InvoiceNo'].str.contains('C')]
 
 
 def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
@@ -50,52 +229,88 @@ def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
                 f"Data is missing column '{target.title()}'."
                 f"\nA .csv or excel file must be uploaded with"
                 f" the columns 'Invoice', 'Description', and 'Quantity'.")
-    df = df.dropna(axis=0, subset=['InvoiceNo'])
-    df['InvoiceNo'] = df['InvoiceNo'].astype(str)
-    df = df[~df['InvoiceNo'].str.contains('C')]
-    return df
+    return drop_credits(df)
 
 
-def encode_data(datapoint: int) -> int:
-    """ One hot encode the purchase quantity of items
+def encode_baskets(
+        df: pd.DataFrame) -> Tuple[sparse.csr_matrix, pd.Index, pd.Index]:
+    """ One hot encode transactions into a sparse invoice x item matrix
 
     Args:
-        datapoint (int): The purchase quantity of a given item
+        df (pd.DataFrame): DataFrame with columns
+            InvoiceNo, Description, and Quantity
 
     Returns:
-        int: 0 for non positive quantities. 1 otherwise
+        Tuple[sparse.csr_matrix, pd.Index, pd.Index]: A boolean matrix where
+            the rows are InvoiceNos and the columns are Descriptions, the
+            sorted InvoiceNos, and the sorted Descriptions. An entry is True
+            when the total purchase quantity of the item on the invoice is
+            positive.
     """
-    if datapoint <= 0:
-        return 0
-    else:
-        return 1
-
-
-def count_items_per_transaction(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.dropna(subset=['Description'])
+    invoice_codes, invoices = pd.factorize(df['InvoiceNo'], sort=True)
+    item_codes, items = pd.factorize(df['Description'], sort=True)
+    quantities = df['Quantity'].fillna(0).to_numpy(dtype=np.float64)
+
+    # Duplicate (invoice, item) pairs are summed when converting to CSR,
+    # which matches the groupby sum of the quantities.
+    totals = sparse.coo_matrix(
+        (quantities, (invoice_codes, item_codes)),
+        shape=(len(invoices), len(items))
+    ).tocsr()
+    totals.sum_duplicates()
+    totals.data = totals.data > 0
+    totals.eliminate_zeros()
+    return totals.astype(bool), invoices, items
+
+
+def count_items_per_transaction(
+        df: pd.DataFrame,
+        sparse_output: Optional[bool] = None) -> pd.DataFrame:
     """ Count the number of items by InvoiceNo and Description
 
     Args:
         df (pd.DataFrame): DataFrame with columns
             InvoiceNo, Description, and Quantity
+        sparse_output (bool, optional): Return a pandas sparse boolean
+            DataFrame. If None, a sparse DataFrame is returned only when the
+            basket has more than DENSE_CELL_LIMIT cells. Defaults to None.
 
     Returns:
         pd.DataFrame: A one hot encoded DataFrame where the rows are
             InvoiceNos and the columns are Descriptions.
     """
-    market_basket = df.groupby(
-        ['InvoiceNo', 'Description'])['Quantity']
-    market_basket = market_basket.sum().unstack().reset_index().fillna(0).\
-        set_index('InvoiceNo')
-    market_basket = market_basket.applymap(encode_data)
-    return market_basket
+    matrix, invoices, items = encode_baskets(df)
+    invoices = pd.Index(invoices, name='InvoiceNo')
+    items = pd.Index(items, name='Description')
+    if sparse_output is None:
+        sparse_output = matrix.shape[0] * matrix.shape[1] > DENSE_CELL_LIMIT
+
+    if sparse_output:
+        return pd.DataFrame.sparse.from_spmatrix(
+            matrix,
+            index=invoices,
+            columns=items
+        )
+    return pd.DataFrame(
+        matrix.toarray().astype(int),
+        index=invoices,
+        columns=items
+    )
 
 
 def make_rules(
         one_hot_df: pd.DataFrame,
-        min_support: float = 0.03,
+        min_support: Optional[float] = 0.03,
         lift_thresh: float = 1,
         conf_thresh: float = 0.5,
-        lev_thresh: float = 0.03) -> Rules:
+        lev_thresh: float = 0.03,
+        engine: str = 'auto',
+        progress: Optional[Callable[..., None]] = None,
+        n_jobs: int = 1,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None,
+        max_bytes: Optional[int] = None) -> Rules:
     """ Make association rules DataFrames based on confidence, lift,
         and leverage
 
@@ -103,53 +318,425 @@ def make_rules(
         one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
             rows as InvoiceNos and columns as Descriptions
         min_support (float, optional): The support threshold for generating
-            frequent itemsets. Defaults to 0.03.
+            frequent itemsets, or None for the lowest support that fits the
+            budget. Defaults to 0.03.
         lift_thresh (float, optional): The threshold for calculating
             lift metrics. Defaults to 1.
         conf_thresh (float, optional): The threshold for calculating
             confidence metrics. Defaults to 0.5.
         lev_thresh (float, optional): The threshold for calculating leverage
             metrics. Defaults to 0.03.
+        engine (str, optional): The frequent itemset engine. One of the
+            engines registered in engines.ENGINES such as 'fpgrowth' or
+            'bitset', or 'auto' to pick one from the size and density of
+            one_hot_df. Defaults to 'auto'.
+        progress (Callable[..., None], optional): Called with 'mining'
+            and the invoices and items of one_hot_df, then with 'rules' and
+            the number of frequent itemsets, as each stage starts.
+            Defaults to None.
+        n_jobs (int, optional): The number of processes mining with the
+            'auto' engine. Uploads large enough for more than one process,
+            which choose_engine would mine with bitsets, are mined by
+            partition with the 'parallel' engine unless there is a budget.
+            Daemonic processes always mine serially. 0 means one per CPU.
+            Defaults to 1.
+        max_itemsets (int, optional): The most frequent itemsets allowed.
+            Defaults to None.
+        max_rules (int, optional): The most rules allowed. Defaults to None.
+        max_bytes (int, optional): The memory allowed for itemsets and
+            rules. Defaults to None.
+
+    Raises:
+        MiningBudgetExceeded: Mining stopped because it exceeded the budget.
 
     Returns:
         Rules: Assocation rules DataFrames for confidence,
-            lift, and leverage metrics.
+            lift, and leverage metrics, the name of the engine that
+            mined the itemsets, the table of all rules with every
+            metric, and the support threshold used.
+    """
+    progress = progress or (lambda stage, **details: None)
+    progress(
+        'mining',
+        invoices=len(one_hot_df.index),
+        items=len(one_hot_df.columns)
+    )
+    max_itemsets, max_rules = budget_counts(max_itemsets, max_rules, max_bytes)
+    budgeted = max_itemsets is not None or max_rules is not None
+    n_jobs = effective_jobs(n_jobs, len(one_hot_df.index))
+    if min_support is None:
+        min_support, itemsets, engine = tune_min_support(
+            one_hot_df,
+            max_itemsets=max_itemsets,
+            max_rules=max_rules,
+            engine=engine
+        )
+    elif (engine == 'auto' and n_jobs > 1 and not budgeted
+            and choose_engine(one_hot_df) == 'bitset'):
+        engine = 'parallel'
+        itemsets = parallel_itemsets(one_hot_df, min_support, n_jobs)
+    else:
+        # fpgrowth only checks the budget once it finishes
+        if engine == 'auto' and budgeted:
+            engine = 'bitset'
+        engine, find_itemsets = get_engine(engine, one_hot_df)
+        itemsets = find_itemsets(
+            one_hot_df,
+            min_support,
+            max_itemsets=max_itemsets,
+            max_rules=max_rules
+        )
+    progress('rules', itemsets=len(itemsets))
+    return filter_rules(
+        generate_rules(itemsets),
+        lift_thresh=lift_thresh,
+        conf_thresh=conf_thresh,
+        lev_thresh=lev_thresh,
+        engine=engine
+    )._replace(min_support=min_support)
+
+
+def generate_rules(itemsets: pd.DataFrame) -> pd.DataFrame:
+    """ Enumerate every association rule of the frequent itemsets once and
+        compute all of its metrics as vectorized columns
+
+    Args:
+        itemsets (pd.DataFrame): frequent itemsets with the columns
+            support and itemsets
+
+    Returns:
+        pd.DataFrame: One row per rule with the columns of mlxtend's
+            association_rules: antecedents, consequents, antecedent support,
+            consequent support, support, confidence, lift, leverage,
+            and conviction.
+    """
+    supports = dict(zip(itemsets['itemsets'].map(frozenset),
+                        itemsets['support']))
+    antecedents, consequents = [], []
+    sAC, sA, sC = [], [], []
+    for itemset, support in supports.items():
+        for size in range(len(itemset) - 1, 0, -1):
+            for combination in combinations(itemset, r=size):
+                antecedent = frozenset(combination)
+                consequent = itemset.difference(antecedent)
+                antecedents.append(antecedent)
+                consequents.append(consequent)
+                sAC.append(support)
+                sA.append(supports[antecedent])
+                sC.append(supports[consequent])
+
+    sAC = np.array(sAC, dtype=float)
+    sA = np.array(sA, dtype=float)
+    sC = np.array(sC, dtype=float)
+    confidence = sAC / sA
+    conviction = np.full_like(confidence, np.inf)
+    uncertain = confidence < 1.
+    conviction[uncertain] = (1. - sC[uncertain]) / (1. - confidence[uncertain])
+    return pd.DataFrame({
+        'antecedents': antecedents,
+        'consequents': consequents,
+        'antecedent support': sA,
+        'consequent support': sC,
+        'support': sAC,
+        'confidence': confidence,
+        'lift': confidence / sC,
+        'leverage': sAC - sA * sC,
+        'conviction': conviction
+    })
+
+
+def filter_rules(
+        rules: pd.DataFrame,
+        lift_thresh: float = 1,
+        conf_thresh: float = 0.5,
+        lev_thresh: float = 0.03,
+        engine: str = None) -> Rules:
+    """ Split a table of rules from generate_rules into the confidence,
+        lift, and leverage views
+
+    Args:
+        rules (pd.DataFrame): rules with all metrics from generate_rules
+        lift_thresh (float, optional): The threshold for lift.
+            Defaults to 1.
+        conf_thresh (float, optional): The threshold for confidence.
+            Defaults to 0.5.
+        lev_thresh (float, optional): The threshold for leverage.
+            Defaults to 0.03.
+        engine (str, optional): The engine that mined the itemsets.
+            Defaults to None.
+
+    Returns:
+        Rules: Assocation rules DataFrames for confidence,
+            lift, and leverage metrics, and the full table of rules.
+    """
+    def view(metric: str, threshold: float) -> pd.DataFrame:
+        keep = rules[metric].to_numpy() >= threshold
+        return rules.loc[keep, ['antecedents', 'consequents', metric]]\
+            .reset_index(drop=True)
+
+    return Rules(
+        confidence=view('confidence', conf_thresh),
+        lift=view('lift', lift_thresh),
+        leverage=view('leverage', lev_thresh),
+        engine=engine,
+        table=rules
+    )
+
+
+def estimate_upload(
+        df: pd.DataFrame,
+        min_support: Optional[float]) -> Estimate:
+    """ Estimate the memory needed to mine prepared transactions from
+        their distinct invoices and items and a sample of their baskets
+
+    Args:
+        df (pd.DataFrame): DataFrame from prepare_data
+        min_support (Optional[float]): The support threshold, or None when
+            it is tuned to a budget
+
+    Returns:
+        Estimate: The estimate, with the representation of the basket
+            matrix that fits JOB_MEMORY_BYTES.
+    """
+    invoices = df['InvoiceNo'].unique()
+    if len(invoices) > SAMPLE_INVOICES:
+        invoices = np.random.default_rng(0).choice(
+            invoices,
+            size=SAMPLE_INVOICES,
+            replace=False
+        )
+    sample, _, _ = encode_baskets(df[df['InvoiceNo'].isin(invoices)])
+    return estimate_job(
+        n_rows=len(df),
+        n_invoices=df['InvoiceNo'].nunique(),
+        n_items=df['Description'].nunique(),
+        sample=sample,
+        min_support=min_support,
+        memory_budget=JOB_MEMORY_BYTES,
+        dense_cell_limit=DENSE_CELL_LIMIT
+    )
+
+
+def preflight_upload(
+        df: pd.DataFrame,
+        min_support: Optional[float],
+        progress: Callable[..., None]) -> Estimate:
+    """ Estimate the memory needed to mine prepared transactions and
+        report it as the 'preflight' stage
+
+    Raises:
+        JobTooLarge: The transactions need more than JOB_MEMORY_BYTES.
+    """
+    estimate = estimate_upload(df, min_support)
+    progress('preflight', estimate=estimate._asdict())
+    check_estimate(estimate, JOB_MEMORY_BYTES)
+    return estimate
+
+
+def rules_from_user_upload(
+        df: pd.DataFrame,
+        progress: Optional[Callable[..., None]] = None) -> Rules:
+    """ Calculate rules from uploaded transactions
+
+    Args:
+        df (pd.DataFrame): DataFrame containing transaction data
+        progress (Callable[..., None], optional): Called with 'preparing',
+            'preflight' and the estimate as a dict, then with 'encoding',
+            'mining', and 'rules' as each stage starts, with the details of
+            make_rules. Defaults to None.
+
+    Raises:
+        JobTooLarge: The upload needs more than JOB_MEMORY_BYTES.
+
+    Returns:
+        Rules: DataFrames of association rules for lift, confidence,
+            and leverage metrics.
     """
-    itemsets = fpgrowth(
+    progress = progress or (lambda stage, **details: None)
+    progress('preparing')
+    df = prepare_data(df)
+    min_support = None if TUNE_MIN_SUPPORT else MIN_SUPPORT
+    estimate = preflight_upload(df, min_support, progress)
+    progress('encoding')
+    one_hot_df = count_items_per_transaction(
+        df,
+        sparse_output=estimate.representation == 'sparse'
+    )
+    return make_rules(
         one_hot_df,
         min_support=min_support,
-        use_colnames=True
+        progress=progress,
+        n_jobs=MINING_WORKERS,
+        **MINING_BUDGET,
+        **THRESHOLDS
     )
 
-    rules_lift = association_rules(
-            itemsets,
-            metric='lift',
-            min_threshold=lift_thresh
-        )[['antecedents', 'consequents', 'lift']]
 
-    rules_conf = association_rules(
-        itemsets,
-        metric='confidence',
-        min_threshold=conf_thresh
-    )[['antecedents', 'consequents', 'confidence']]
+def rules_from_appended_upload(
+        df: pd.DataFrame,
+        state: Optional[MiningState],
+        load_all: Callable[[], pd.DataFrame],
+        progress: Optional[Callable[..., None]] = None
+        ) -> Tuple[Rules, MiningState]:
+    """ Calculate rules after transactions were appended to an upload,
+        updating the counts of the previous mining state instead of mining
+        every transaction again when no new itemset became frequent.
+        Appended rows must belong to new invoices, as the state cannot add
+        items to the baskets it counted; pass state as None otherwise.
+
+    The transactions are mined with MIN_SUPPORT, as the counts of the
+    state are only valid for the support they were mined with, so
+    TUNE_MIN_SUPPORT and MINING_BUDGET do not apply and the rules are not
+    cached. Each batch of transactions that is encoded is checked against
+    JOB_MEMORY_BYTES first.
 
-    rules_leverage = association_rules(
-        itemsets,
-        metric='leverage',
-        min_threshold=lev_thresh
-    )[['antecedents', 'consequents', 'leverage']]
+    Args:
+        df (pd.DataFrame): The transactions appended since state was built,
+            or every transaction when state is None
+        state (Optional[MiningState]): The mining state of the upload
+            before the rows were appended
+        load_all (Callable[[], pd.DataFrame]): Reads every transaction of
+            the upload when it has to be mined again
+        progress (Callable[..., None], optional): Called with 'preparing',
+            'preflight' and the estimate as a dict, 'encoding', 'mining',
+            and 'rules' as each stage starts, with the details of
+            make_rules. Defaults to None.
+
+    Raises:
+        JobTooLarge: The transactions need more than JOB_MEMORY_BYTES.
 
-    return Rules(
-        confidence=rules_conf,
-        lift=rules_lift,
-        leverage=rules_leverage
+    Returns:
+        Tuple[Rules, MiningState]: DataFrames of association rules for
+            lift, confidence, and leverage metrics, and the mining state
+            of every transaction.
+    """
+    progress = progress or (lambda stage, **details: None)
+
+    def encode(df: pd.DataFrame) -> pd.DataFrame:
+        progress('preparing')
+        df = prepare_data(df)
+        estimate = preflight_upload(df, MIN_SUPPORT, progress)
+        progress('encoding')
+        one_hot_df = count_items_per_transaction(
+            df,
+            sparse_output=estimate.representation == 'sparse'
+        )
+        progress(
+            'mining',
+            invoices=len(one_hot_df.index),
+            items=len(one_hot_df.columns)
+        )
+        return one_hot_df
+
+    one_hot_df = encode(df)
+    updated = None
+    if state is not None and state.min_support == MIN_SUPPORT:
+        updated = update_state(state, one_hot_df)
+    if updated is not None:
+        engine = 'incremental'
+    else:
+        if state is not None:
+            one_hot_df = encode(load_all())
+        updated, engine = build_state(one_hot_df, MIN_SUPPORT)
+    itemsets = updated.itemsets()
+    # Every transaction, not only the appended ones that were encoded
+    progress(
+        'rules',
+        invoices=updated.n_transactions,
+        items=updated.n_items(),
+        itemsets=len(itemsets)
+    )
+    rules = filter_rules(
+        generate_rules(itemsets),
+        engine=engine,
+        **THRESHOLDS
     )
+    return rules, updated
+
+
+def partition_candidates(df: pd.DataFrame) -> List[List[str]]:
+    """ Locally frequent itemsets of a partition of an upload, the
+        candidates of mining by partition
 
+    Partitions are mined with MIN_SUPPORT, without TUNE_MIN_SUPPORT or
+    MINING_BUDGET, which need every transaction. Each partition is checked
+    against JOB_MEMORY_BYTES, as each is mined by its own task.
 
-def rules_from_user_upload(df):
+    Args:
+        df (pd.DataFrame): The transactions of a range of invoices
+
+    Raises:
+        JobTooLarge: The partition needs more than JOB_MEMORY_BYTES.
+
+    Returns:
+        List[List[str]]: The frequent itemsets of the partition as sorted
+            item names.
+    """
     df = prepare_data(df)
-    one_hot_df = count_items_per_transaction(df)
-    return make_rules(one_hot_df, min_support=MIN_SUPPORT)
+    estimate = estimate_upload(df, MIN_SUPPORT)
+    check_estimate(estimate, JOB_MEMORY_BYTES)
+    one_hot_df = count_items_per_transaction(
+        df,
+        sparse_output=estimate.representation == 'sparse'
+    )
+    if not len(one_hot_df.index):
+        return []
+    _, find_itemsets = get_engine('auto', one_hot_df)
+    itemsets = find_itemsets(one_hot_df, MIN_SUPPORT)
+    return [sorted(itemset) for itemset in itemsets['itemsets']]
+
+
+def partition_counts(
+        df: pd.DataFrame,
+        candidates: List[List[str]]) -> Tuple[List[int], int, List[str]]:
+    """ Count the candidates of every partition in one partition
+
+    Args:
+        df (pd.DataFrame): The transactions of a range of invoices
+        candidates (List[List[str]]): The candidates of every partition
+
+    Returns:
+        Tuple[List[int], int, List[str]]: The transaction count of every
+            candidate, the number of transactions in the partition, and its
+            items.
+    """
+    one_hot_df = count_items_per_transaction(prepare_data(df))
+    counts = count_candidates(one_hot_df, candidates)
+    return counts.tolist(), len(one_hot_df.index), \
+        one_hot_df.columns.tolist()
+
+
+def rules_from_partition_counts(
+        candidates: List[List[str]],
+        counts: List[int],
+        n_transactions: int,
+        progress: Optional[Callable[..., None]] = None) -> Rules:
+    """ Calculate rules from the candidate counts summed over partitions
+
+    Args:
+        candidates (List[List[str]]): The candidates of every partition
+        counts (List[int]): The transaction count of every candidate
+        n_transactions (int): The number of transactions in the upload
+        progress (Callable[..., None], optional): Called with 'rules' and
+            the number of frequent itemsets. Defaults to None.
+
+    Returns:
+        Rules: DataFrames of association rules for lift, confidence,
+            and leverage metrics.
+    """
+    itemsets = merge_partitions(
+        candidates,
+        counts,
+        n_transactions,
+        MIN_SUPPORT
+    )
+    if progress is not None:
+        progress('rules', itemsets=len(itemsets))
+    return filter_rules(
+        generate_rules(itemsets),
+        engine='distributed',
+        **THRESHOLDS
+    )
 
 
 def run_demo() -> Rules:
@@ -164,9 +751,9 @@ def run_demo() -> Rules:
                ['Milk', 'Apple', 'Kidney Beans', 'Eggs'],
                ['Milk', 'Unicorn', 'Corn', 'Kidney Beans', 'Yogurt'],
                ['Corn', 'Onion', 'Onion', 'Kidney Beans', 'Ice cream', 'Eggs']]
-    te = TransactionEncoder()
-    te_ary = te.fit(dataset).transform(dataset)
-    one_hot_df = pd.DataFrame(te_ary, columns=te.columns_)
+    items = pd.Series(dataset).explode()
+    one_hot_df = pd.crosstab(items.index, items).astype(bool)\
+        .rename_axis(index=None, columns=None)
     return make_rules(
         one_hot_df,
         min_support=0.6,
@@ -179,19 +766,18 @@ def run_retail_demo(read_rules: bool = True) -> Rules:
     """ Create association rules from Online Retail dataset
         https://pythondata.com/market-basket-analysis-with-python-and-pandas/
     Args:
-        read_rules (bool, optional): Read association rules from file.
-        Generates them otherwise. Defaults to True.
+        read_rules (bool, optional): Read association rules from the
+        Arrow files built by artifacts.py. Generates them otherwise.
+        Defaults to True.
 
     Returns:
         Rules: DataFrames of association rules for lift, confidence,
             and leverage metrics.
     """
     if read_rules:
-        xl = pd.ExcelFile('AssociationRules.xlsx')
-        dfs = {sh: xl.parse(sh) for sh in xl.sheet_names}
-        for key, val in dfs.items():
-            for name in ['antecedents', 'consequents']:
-                dfs[key][name] = val[name].apply(lambda x: eval(x))
+        from artifacts import load_demo_rules
+
+        dfs = load_demo_rules()
         rules = Rules(
             confidence=dfs['confidence'][[
                 'antecedents',
@@ -204,7 +790,7 @@ def run_retail_demo(read_rules: bool = True) -> Rules:
                 'leverage']]
         )
     else:
-        df = read_input_data('OnlineRetail.xlsx')
+        df = read_input_data('OnlineRetail.xlsx', columns=['Country'])
         new_df = prepare_data(df)
         uk_df = new_df[new_df['Country'] == "United Kingdom"]
         market_basket = count_items_per_transaction(uk_df)
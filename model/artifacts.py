@@ -0,0 +1,158 @@
+""" Build and load the precomputed rules of the retail demo, and convert
+rules to and from Arrow tables
+
+Run this module to rebuild the Arrow files from AssociationRules.xlsx:
+
+    python model/artifacts.py
+
+Arrow converts the metric columns read from the files without copying
+them out of the memory map, so processes reading the same file share them
+through the page cache, although pandas before 2.0 copies them into one
+block when it builds the DataFrame. The itemsets are built as frozensets
+in each process. The app does not serve the retail demo, so nothing loads
+it before the web workers fork.
+"""
+import ast
+import os
+import sys
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_SOURCE = os.path.join(MODEL_DIR, 'AssociationRules.xlsx')
+DEMO_DIR = os.path.join(MODEL_DIR, 'demo')
+
+ITEMSET_COLUMNS = ('antecedents', 'consequents')
+VIEWS = ('confidence', 'lift', 'leverage')
+
+
+def parse_frozenset(text: str) -> frozenset:
+    """ Parse the repr of a frozenset of strings without eval
+
+    Args:
+        text (str): A repr such as "frozenset({'A', 'B'})"
+
+    Returns:
+        frozenset: The parsed itemset.
+    """
+    text = text.strip()
+    if not (text.startswith('frozenset(') and text.endswith(')')):
+        raise ValueError(f'Not a frozenset: {text!r}')
+    inner = text[len('frozenset('):-1].strip()
+    return frozenset(ast.literal_eval(inner)) if inner else frozenset()
+
+
+def rules_to_table(rules: pd.DataFrame) -> pa.Table:
+    """ Arrow table of rules with itemsets as lists of strings """
+    columns = {}
+    for name in rules.columns:
+        if name in ITEMSET_COLUMNS:
+            columns[name] = pa.array(
+                [sorted(map(str, itemset)) for itemset in rules[name]],
+                type=pa.list_(pa.string())
+            )
+        else:
+            columns[name] = pa.array(rules[name].to_numpy())
+    return pa.table(columns)
+
+
+def write_rules(rules: pd.DataFrame, path: str) -> None:
+    """ Write rules to an Arrow IPC file, which can be memory mapped """
+    table = rules_to_table(rules)
+    temp = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(temp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp, path)
+
+
+def itemsets_from_arrow(column: pa.ChunkedArray) -> pd.Series:
+    """ Frozensets of a list<string> column. Every distinct item is
+        decoded to one Python string that all of its itemsets share.
+    """
+    lists = column.combine_chunks()
+    offsets = lists.offsets.to_numpy()
+    encoded = lists.flatten().dictionary_encode()
+    items = np.array(encoded.dictionary.to_pylist(), dtype=object)
+    values = items[encoded.indices.to_numpy()].tolist()
+    offsets = (offsets - offsets[0]).tolist()
+    return pd.Series(
+        [frozenset(values[start:end])
+         for start, end in zip(offsets[:-1], offsets[1:])],
+        dtype=object
+    )
+
+
+def table_to_rules(table: pa.Table) -> pd.DataFrame:
+    """ Rules from an Arrow table written by rules_to_table. Metric
+        columns are not copied where Arrow and pandas allow it.
+
+    Args:
+        table (pa.Table): The rules with itemsets as lists of strings
+
+    Returns:
+        pd.DataFrame: The rules with frozenset antecedents and consequents.
+    """
+    rules = {}
+    for name in table.column_names:
+        if name in ITEMSET_COLUMNS:
+            rules[name] = itemsets_from_arrow(table.column(name))
+        else:
+            rules[name] = table.column(name).to_numpy()
+    return pd.DataFrame(rules, copy=False)
+
+
+def read_rules(path: str) -> pd.DataFrame:
+    """ Read rules written by write_rules through a memory map
+
+    Args:
+        path (str): The Arrow IPC file
+
+    Returns:
+        pd.DataFrame: The rules with frozenset antecedents and consequents.
+    """
+    with pa.memory_map(path) as source:
+        return table_to_rules(pa.ipc.open_file(source).read_all())
+
+
+def demo_path(view: str, directory: str = DEMO_DIR) -> str:
+    return os.path.join(directory, f'{view}.arrow')
+
+
+def build_demo_rules(
+        source: str = DEMO_SOURCE,
+        directory: str = DEMO_DIR) -> None:
+    """ Convert the sheets of the demo workbook to Arrow files
+
+    Args:
+        source (str, optional): The workbook with a sheet of rules per
+            view. Defaults to DEMO_SOURCE.
+        directory (str, optional): Where to write the Arrow files.
+            Defaults to DEMO_DIR.
+    """
+    os.makedirs(directory, exist_ok=True)
+    sheets = pd.read_excel(source, sheet_name=list(VIEWS))
+    for view, rules in sheets.items():
+        for name in ITEMSET_COLUMNS:
+            rules[name] = rules[name].map(parse_frozenset)
+        write_rules(rules, demo_path(view, directory))
+
+
+def load_demo_rules(directory: str = DEMO_DIR) -> Dict[str, pd.DataFrame]:
+    """ The rules of every view of the retail demo
+
+    Args:
+        directory (str, optional): The Arrow files written by
+            build_demo_rules. Defaults to DEMO_DIR.
+
+    Returns:
+        Dict[str, pd.DataFrame]: The rules with every metric by view.
+    """
+    return {view: read_rules(demo_path(view, directory)) for view in VIEWS}
+
+
+if __name__ == '__main__':
+    build_demo_rules(*sys.argv[1:])
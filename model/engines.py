@@ -0,0 +1,331 @@
+import math
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+Engine = Callable[..., pd.DataFrame]
+
+ENGINES: Dict[str, Engine] = {}
+
+# The 'auto' engine uses bitsets for baskets at least this dense with at
+# most this many transactions, and fpgrowth otherwise.
+BITSET_MIN_DENSITY = 0.01
+BITSET_MAX_TRANSACTIONS = 1_000_000
+
+# Upper bound on the bytes of bitsets intersected at once by count_itemsets
+COUNT_BATCH_BYTES = 64 * 1024 * 1024
+
+# Number of set bits in every possible byte
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class MiningBudgetExceeded(ValueError):
+    """ Mining found more itemsets or rules than its budget allows """
+
+
+def register_engine(name: str) -> Callable[[Engine], Engine]:
+    """ Register a frequent itemset engine under a name usable by make_rules
+
+    Args:
+        name (str): The name of the engine
+
+    Returns:
+        Callable[[Engine], Engine]: A decorator that registers the engine.
+            An engine takes a one hot encoded DataFrame, a minimum support,
+            and the optional budget max_itemsets and max_rules, and returns
+            a DataFrame with the columns support and itemsets.
+    """
+    def decorator(func: Engine) -> Engine:
+        ENGINES[name] = func
+        return func
+    return decorator
+
+
+def basket_density(one_hot_df: pd.DataFrame) -> float:
+    """ Fraction of nonzero cells in a one hot encoded DataFrame
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+
+    Returns:
+        float: The density of the basket matrix.
+    """
+    if one_hot_df.size == 0:
+        return 0.0
+    if hasattr(one_hot_df, 'sparse'):
+        return one_hot_df.sparse.to_coo().count_nonzero() / one_hot_df.size
+    return np.count_nonzero(one_hot_df.to_numpy()) / one_hot_df.size
+
+
+def choose_engine(one_hot_df: pd.DataFrame) -> str:
+    """ Pick the engine for the 'auto' mode
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+
+    Returns:
+        str: 'bitset' for dense, mid-size baskets. 'fpgrowth' otherwise.
+    """
+    if (len(one_hot_df.index) <= BITSET_MAX_TRANSACTIONS
+            and basket_density(one_hot_df) >= BITSET_MIN_DENSITY):
+        return 'bitset'
+    return 'fpgrowth'
+
+
+def get_engine(name: str, one_hot_df: pd.DataFrame) -> Tuple[str, Engine]:
+    """ Look up a registered engine, resolving 'auto'
+
+    Args:
+        name (str): The name of a registered engine or 'auto'
+        one_hot_df (pd.DataFrame): The DataFrame the engine will mine
+
+    Returns:
+        Tuple[str, Engine]: The name of the engine that will run and
+            the engine itself.
+    """
+    if name == 'auto':
+        name = choose_engine(one_hot_df)
+    if name not in ENGINES:
+        raise ValueError(
+            f"Unknown engine '{name}'. Must be 'auto' or one of"
+            f" {', '.join(sorted(ENGINES))}.")
+    return name, ENGINES[name]
+
+
+def rules_per_itemset(size: int) -> int:
+    """ Number of association rules generated from an itemset """
+    return 2 ** size - 2
+
+
+def check_budget(
+        n_itemsets: int,
+        n_rules: int,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None) -> None:
+    """ Raise MiningBudgetExceeded when a count is over its budget """
+    if max_itemsets is not None and n_itemsets > max_itemsets:
+        raise MiningBudgetExceeded(
+            f'Mining found more than {max_itemsets} frequent itemsets. '
+            'Raise the minimum support or the budget.')
+    if max_rules is not None and n_rules > max_rules:
+        raise MiningBudgetExceeded(
+            f'Mining found more than {max_rules} rules. '
+            'Raise the minimum support or the budget.')
+
+
+@register_engine('fpgrowth')
+def fpgrowth_itemsets(
+        one_hot_df: pd.DataFrame,
+        min_support: float,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None) -> pd.DataFrame:
+    """ Frequent itemsets from mlxtend's fpgrowth. fpgrowth cannot be
+        stopped early, so the budget is only checked once it finishes.
+    """
+    from mlxtend.frequent_patterns import fpgrowth
+
+    itemsets = fpgrowth(
+        one_hot_df,
+        min_support=min_support,
+        use_colnames=True
+    )
+    check_budget(
+        len(itemsets),
+        int(itemsets['itemsets'].map(len).map(rules_per_itemset).sum()),
+        max_itemsets=max_itemsets,
+        max_rules=max_rules
+    )
+    return itemsets
+
+
+def min_counts(min_support: float, n_rows: int) -> Tuple[int, int]:
+    """ Transaction counts needed for an itemset to be frequent. Single
+        items are compared as fractions and larger itemsets as counts,
+        the same way fpgrowth does, so every engine agrees on the boundary.
+
+    Args:
+        min_support (float): The support threshold
+        n_rows (int): The number of transactions
+
+    Returns:
+        Tuple[int, int]: The minimum count of single items and of
+            larger itemsets.
+    """
+    min_count = math.ceil(min_support * n_rows)
+    min_singleton = min_count
+    while min_singleton > 0 and (min_singleton - 1) / n_rows >= min_support:
+        min_singleton -= 1
+    return min_singleton, min_count
+
+
+def pack_columns(one_hot_df: pd.DataFrame) -> np.ndarray:
+    """ Pack the transactions of every item into a bitset
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+
+    Returns:
+        np.ndarray: A uint8 array of shape (items, ceil(transactions / 8))
+            where bit j of row i is set when item i is in transaction j.
+    """
+    if hasattr(one_hot_df, 'sparse') and one_hot_df.size:
+        return pack_matrix(one_hot_df.sparse.to_coo())
+    values = one_hot_df.to_numpy().astype(bool)
+    return np.ascontiguousarray(np.packbits(values, axis=0).T)
+
+
+def pack_matrix(baskets: sparse.spmatrix) -> np.ndarray:
+    """ pack_columns of a sparse transaction x item matrix """
+    coo = sparse.coo_matrix(baskets)
+    n_rows, n_cols = coo.shape
+    keep = coo.data != 0
+    rows, cols = coo.row[keep], coo.col[keep]
+    bits = np.zeros((n_cols, (n_rows + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(
+        bits,
+        (cols, rows >> 3),
+        (128 >> (rows & 7)).astype(np.uint8)
+    )
+    return bits
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """ Count the set bits along the last axis of a packed bitset array """
+    return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+
+def count_itemsets(
+        bits: np.ndarray,
+        itemsets: Sequence[Tuple[int, ...]]) -> np.ndarray:
+    """ Count the transactions containing each itemset, intersecting the
+        bitsets of all itemsets of the same size at once
+
+    Args:
+        bits (np.ndarray): Item bitsets from pack_columns
+        itemsets (Sequence[Tuple[int, ...]]): Itemsets as item positions
+
+    Returns:
+        np.ndarray: The transaction count of every itemset.
+    """
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    by_size = defaultdict(list)
+    for i, itemset in enumerate(itemsets):
+        by_size[len(itemset)].append(i)
+    batch = max(1, COUNT_BATCH_BYTES // max(1, bits.shape[1]))
+    for size, positions in by_size.items():
+        positions = np.array(positions)
+        items = np.array([itemsets[i] for i in positions], dtype=np.intp)
+        for start in range(0, len(positions), batch):
+            chunk = items[start:start + batch]
+            joined = bits[chunk[:, 0]]
+            for j in range(1, size):
+                joined = joined & bits[chunk[:, j]]
+            counts[positions[start:start + batch]] = popcount(joined)
+    return counts
+
+
+def eclat(
+        bits: np.ndarray,
+        min_count: int,
+        min_singleton: int = None,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None
+        ) -> List[Tuple[Tuple[int, ...], int]]:
+    """ Depth first search for frequent itemsets over item bitsets. The
+        extensions of each prefix are intersected and counted in one
+        vectorized AND/popcount.
+
+    Args:
+        bits (np.ndarray): Item bitsets from pack_columns
+        min_count (int): The minimum number of transactions that must
+            contain an itemset
+        min_singleton (int, optional): The minimum count for single items.
+            Defaults to min_count.
+        max_itemsets (int, optional): Stop with MiningBudgetExceeded once
+            more itemsets are found. Defaults to None.
+        max_rules (int, optional): Stop with MiningBudgetExceeded once the
+            itemsets found generate more rules. Defaults to None.
+
+    Returns:
+        List[Tuple[Tuple[int, ...], int]]: Pairs of frequent itemsets as
+            sorted item positions and their transaction counts.
+    """
+    if min_singleton is None:
+        min_singleton = min_count
+    counts = popcount(bits)
+    frequent = np.flatnonzero(counts >= min_singleton)
+    found = [((int(item),), int(counts[item])) for item in frequent]
+    n_rules = 0
+    check_budget(len(found), n_rules, max_itemsets, max_rules)
+    stack = [
+        ((int(item),), bits[item], frequent[i + 1:])
+        for i, item in enumerate(frequent)
+    ]
+    while stack:
+        prefix, prefix_bits, extensions = stack.pop()
+        if not len(extensions):
+            continue
+        joined = bits[extensions] & prefix_bits
+        counts = popcount(joined)
+        keep = counts >= min_count
+        extensions, joined, counts = extensions[keep], joined[keep], \
+            counts[keep]
+        for i, item in enumerate(extensions):
+            itemset = prefix + (int(item),)
+            found.append((itemset, int(counts[i])))
+            stack.append((itemset, joined[i], extensions[i + 1:]))
+        n_rules += len(extensions) * rules_per_itemset(len(prefix) + 1)
+        check_budget(len(found), n_rules, max_itemsets, max_rules)
+    return found
+
+
+@register_engine('bitset')
+def bitset_itemsets(
+        one_hot_df: pd.DataFrame,
+        min_support: float,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None) -> pd.DataFrame:
+    """ Frequent itemsets counted over vertical bitsets (Eclat)
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+        min_support (float): The support threshold for generating
+            frequent itemsets.
+        max_itemsets (int, optional): Stop with MiningBudgetExceeded once
+            more itemsets are found. Defaults to None.
+        max_rules (int, optional): Stop with MiningBudgetExceeded once the
+            itemsets found generate more rules. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The columns support and itemsets, in the same format
+            as fpgrowth with use_colnames=True.
+    """
+    if min_support <= 0.:
+        raise ValueError('`min_support` must be a positive '
+                         'number within the interval `(0, 1]`. '
+                         'Got %s.' % min_support)
+    n_rows = len(one_hot_df.index)
+    if n_rows == 0:
+        return pd.DataFrame(columns=['support', 'itemsets'])
+    min_singleton, min_count = min_counts(min_support, n_rows)
+    found = eclat(
+        pack_columns(one_hot_df),
+        min_count=min_count,
+        min_singleton=min_singleton,
+        max_itemsets=max_itemsets,
+        max_rules=max_rules
+    )
+    columns = one_hot_df.columns
+    return pd.DataFrame({
+        'support': [count / n_rows for _, count in found],
+        'itemsets': [
+            frozenset(columns[i] for i in itemset) for itemset, _ in found
+        ]
+    })
@@ -0,0 +1,202 @@
+import json
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engines import count_itemsets, get_engine, min_counts, pack_columns
+
+Itemset = FrozenSet[str]
+
+
+class MiningState:
+    """ Transaction counts of the frequent itemsets mined so far and of
+        their negative border, the itemsets that are not frequent but whose
+        subsets all are. When transactions are appended only these counts
+        need updating, unless a border itemset becomes frequent (FUP).
+    """
+    def __init__(
+            self,
+            min_support: float,
+            n_transactions: int,
+            counts: Dict[Itemset, int]):
+        self.min_support = min_support
+        self.n_transactions = n_transactions
+        self.counts = counts
+
+    def frequent(self) -> Dict[Itemset, int]:
+        """ The frequent itemsets and their counts """
+        if not self.n_transactions:
+            return {}
+        min_singleton, min_count = min_counts(
+            self.min_support,
+            self.n_transactions
+        )
+        return {
+            itemset: count for itemset, count in self.counts.items()
+            if count >= (min_singleton if len(itemset) == 1 else min_count)
+        }
+
+    def n_items(self) -> int:
+        """ The number of items in the transactions, as every item is
+            counted either as frequent or in the negative border
+        """
+        return sum(len(itemset) == 1 for itemset in self.counts)
+
+    def itemsets(self) -> pd.DataFrame:
+        """ The frequent itemsets in the format of fpgrowth with
+            use_colnames=True
+        """
+        frequent = self.frequent()
+        return pd.DataFrame({
+            'support': [
+                count / self.n_transactions for count in frequent.values()
+            ],
+            'itemsets': list(frequent)
+        })
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'min_support': self.min_support,
+            'n_transactions': self.n_transactions,
+            'itemsets': [sorted(itemset) for itemset in self.counts],
+            'counts': list(self.counts.values())
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> 'MiningState':
+        state = json.loads(data)
+        return cls(
+            min_support=state['min_support'],
+            n_transactions=state['n_transactions'],
+            counts=dict(zip(map(frozenset, state['itemsets']),
+                            state['counts']))
+        )
+
+
+def negative_border(
+        frequent: Set[Itemset],
+        items: Iterable[str]) -> Set[Itemset]:
+    """ Minimal itemsets that are not frequent
+
+    Args:
+        frequent (Set[Itemset]): A downward closed set of frequent itemsets
+        items (Iterable[str]): Every item in the transactions
+
+    Returns:
+        Set[Itemset]: The infrequent single items and the infrequent
+            itemsets whose immediate subsets are all frequent.
+    """
+    border = {
+        frozenset([item]) for item in items
+        if frozenset([item]) not in frequent
+    }
+    by_prefix = defaultdict(list)
+    for itemset in frequent:
+        ordered = tuple(sorted(itemset, key=str))
+        by_prefix[ordered[:-1]].append(ordered[-1])
+    for prefix, lasts in by_prefix.items():
+        lasts = sorted(lasts, key=str)
+        for i, first in enumerate(lasts):
+            for second in lasts[i + 1:]:
+                candidate = frozenset(prefix + (first, second))
+                if candidate in frequent:
+                    continue
+                if all(candidate - {item} in frequent for item in candidate):
+                    border.add(candidate)
+    return border
+
+
+def column_positions(
+        one_hot_df: pd.DataFrame,
+        itemsets: Iterable[Itemset]) -> Tuple[np.ndarray, list]:
+    """ Item bitsets of a one hot encoded DataFrame with an extra empty
+        bitset for items it does not contain, and every itemset as a tuple
+        of positions into them
+    """
+    bits = pack_columns(one_hot_df)
+    bits = np.vstack([bits, np.zeros((1, bits.shape[1]), dtype=np.uint8)])
+    missing = len(one_hot_df.columns)
+    position = {item: i for i, item in enumerate(one_hot_df.columns)}
+    positions = [
+        tuple(position.get(item, missing) for item in itemset)
+        for itemset in itemsets
+    ]
+    return bits, positions
+
+
+def build_state(
+        one_hot_df: pd.DataFrame,
+        min_support: float,
+        engine: str = 'auto') -> Tuple[MiningState, str]:
+    """ Mine all transactions and count the negative border
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+        min_support (float): The support threshold for generating
+            frequent itemsets.
+        engine (str, optional): The frequent itemset engine.
+            Defaults to 'auto'.
+
+    Returns:
+        Tuple[MiningState, str]: The mining state and the name of the
+            engine that mined the itemsets.
+    """
+    n_transactions = len(one_hot_df.index)
+    engine, find_itemsets = get_engine(engine, one_hot_df)
+    itemsets = find_itemsets(one_hot_df, min_support)
+    counts = {
+        frozenset(itemset): int(round(support * n_transactions))
+        for itemset, support in zip(itemsets['itemsets'], itemsets['support'])
+    }
+    border = list(negative_border(set(counts), one_hot_df.columns))
+    bits, positions = column_positions(one_hot_df, border)
+    counts.update(zip(border, count_itemsets(bits, positions).tolist()))
+    return MiningState(min_support, n_transactions, counts), engine
+
+
+def update_state(
+        state: MiningState,
+        delta_one_hot_df: pd.DataFrame) -> Optional[MiningState]:
+    """ Add appended transactions to a mining state
+
+    Args:
+        state (MiningState): The state of the transactions mined so far
+        delta_one_hot_df (pd.DataFrame): the appended transactions one hot
+            encoded with rows as InvoiceNos and columns as Descriptions
+
+    Returns:
+        Optional[MiningState]: The state of all transactions, or None when
+            an itemset of the negative border became frequent and the
+            transactions must be mined again.
+    """
+    if not len(delta_one_hot_df.index):
+        return state
+    counts = dict(state.counts)
+    for item in delta_one_hot_df.columns:
+        counts.setdefault(frozenset([item]), 0)
+
+    tracked = list(counts)
+    bits, positions = column_positions(delta_one_hot_df, tracked)
+    for itemset, count in zip(tracked, count_itemsets(bits, positions)):
+        counts[itemset] += int(count)
+
+    updated = MiningState(
+        state.min_support,
+        state.n_transactions + len(delta_one_hot_df.index),
+        counts
+    )
+    frequent = set(updated.frequent())
+    if frequent - set(state.frequent()):
+        return None
+
+    # Itemsets that stopped being frequent join the border, and border
+    # itemsets with a subset that stopped being frequent leave it.
+    updated.counts = {
+        itemset: count for itemset, count in counts.items()
+        if itemset in frequent or len(itemset) == 1
+        or all(itemset - {item} in frequent for item in itemset)
+    }
+    return updated
@@ -0,0 +1,220 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engines import bitset_itemsets, count_itemsets, eclat, min_counts, \
+    pack_columns
+from incremental import column_positions
+
+# Each worker mines at least this many transactions. Smaller uploads are
+# mined by fewer processes, down to the serial path.
+MIN_PARTITION_TRANSACTIONS = 20_000
+
+# The item bitsets of the upload being mined, set before the pool forks so
+# that every worker process inherits them copy-on-write. Shared memory
+# would live in /dev/shm, which containers cap at 64 MB by default.
+_bits: Optional[np.ndarray] = None
+
+
+def _mine_partition(
+        start: int,
+        stop: int,
+        n_rows: int,
+        min_support: float) -> List[Tuple[int, ...]]:
+    """ Locally frequent itemsets of the transactions in bytes start to
+        stop of the shared bitsets
+    """
+    min_singleton, min_count = min_counts(min_support, n_rows)
+    found = eclat(
+        np.ascontiguousarray(_bits[:, start:stop]),
+        min_count=min_count,
+        min_singleton=min_singleton
+    )
+    return [itemset for itemset, _ in found]
+
+
+def _count(itemsets: List[Tuple[int, ...]]) -> np.ndarray:
+    return count_itemsets(_bits, itemsets)
+
+
+def effective_jobs(n_jobs: Optional[int], n_rows: int) -> int:
+    """ Number of processes worth starting to mine n_rows transactions
+
+    Args:
+        n_jobs (Optional[int]): The requested number of processes. None or
+            a number below 1 means one per CPU.
+        n_rows (int): The number of transactions
+
+    Returns:
+        int: At most n_jobs, and 1 when the transactions should be mined
+            serially, as they must be in daemonic processes such as the
+            workers of Celery's prefork pool, which cannot start children.
+    """
+    if multiprocessing.current_process().daemon:
+        return 1
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    return max(1, min(n_jobs, n_rows // MIN_PARTITION_TRANSACTIONS))
+
+
+def eclat_order(itemsets: Iterable[Tuple[int, ...]]) -> List[Tuple[int, ...]]:
+    """ Order a downward closed set of itemsets the way eclat finds them,
+        so the parallel and serial bitset engines return the same frame
+    """
+    children: Dict[Tuple[int, ...], List[Tuple[int, ...]]] = {}
+    singletons = []
+    for itemset in itemsets:
+        if len(itemset) == 1:
+            singletons.append(itemset)
+        else:
+            children.setdefault(itemset[:-1], []).append(itemset)
+    found = sorted(singletons)
+    stack = list(found)
+    while stack:
+        extended = sorted(children.get(stack.pop(), []))
+        found.extend(extended)
+        stack.extend(extended)
+    return found
+
+
+def parallel_itemsets(
+        one_hot_df: pd.DataFrame,
+        min_support: float,
+        n_jobs: Optional[int] = None) -> pd.DataFrame:
+    """ Frequent itemsets mined by partition (SON) over a process pool.
+        The worker processes are forked with the item bitsets, every
+        process mines the locally frequent itemsets of a range of
+        transactions, and the union of those candidates is recounted over
+        all transactions. Every frequent itemset is locally frequent in
+        some partition, so the result is the same as the serial bitset
+        engine's, which mines the transactions when effective_jobs is 1.
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+        min_support (float): The support threshold for generating
+            frequent itemsets.
+        n_jobs (int, optional): The number of processes. Defaults to one
+            per CPU.
+
+    Returns:
+        pd.DataFrame: The columns support and itemsets, in the same format
+            as fpgrowth with use_colnames=True.
+    """
+    if min_support <= 0.:
+        raise ValueError('`min_support` must be a positive '
+                         'number within the interval `(0, 1]`. '
+                         'Got %s.' % min_support)
+    n_rows = len(one_hot_df.index)
+    n_jobs = effective_jobs(n_jobs, n_rows)
+    if n_rows == 0:
+        return pd.DataFrame(columns=['support', 'itemsets'])
+    if n_jobs == 1:
+        return bitset_itemsets(one_hot_df, min_support)
+
+    global _bits
+    _bits = pack_columns(one_hot_df)
+    try:
+        # Partitions start on byte boundaries so no transaction is split
+        bounds = np.linspace(0, _bits.shape[1], n_jobs + 1).astype(int)\
+            .tolist()
+        with ProcessPoolExecutor(
+                n_jobs,
+                mp_context=multiprocessing.get_context('fork')) as pool:
+            partitions = [
+                pool.submit(
+                    _mine_partition,
+                    start,
+                    stop,
+                    min(stop * 8, n_rows) - start * 8,
+                    min_support
+                )
+                for start, stop in zip(bounds[:-1], bounds[1:])
+                if stop > start
+            ]
+            candidates = sorted(set().union(
+                *(partition.result() for partition in partitions)))
+            chunks = [
+                candidates[i::n_jobs] for i in range(n_jobs)
+            ]
+            counts = dict(zip(
+                (itemset for chunk in chunks for itemset in chunk),
+                (int(count) for chunk_counts in pool.map(_count, chunks)
+                 for count in chunk_counts)
+            ))
+    finally:
+        _bits = None
+
+    min_singleton, min_count = min_counts(min_support, n_rows)
+    frequent = eclat_order(
+        itemset for itemset, count in counts.items()
+        if count >= (min_singleton if len(itemset) == 1 else min_count)
+    )
+    columns = one_hot_df.columns
+    return pd.DataFrame({
+        'support': [counts[itemset] / n_rows for itemset in frequent],
+        'itemsets': [
+            frozenset(columns[i] for i in itemset) for itemset in frequent
+        ]
+    })
+
+
+def count_candidates(
+        one_hot_df: pd.DataFrame,
+        candidates: Sequence[Iterable[str]]) -> np.ndarray:
+    """ Count the transactions of one partition containing each candidate
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+        candidates (Sequence[Iterable[str]]): Itemsets as item names.
+            Items the partition does not contain are counted as empty.
+
+    Returns:
+        np.ndarray: The transaction count of every candidate.
+    """
+    bits, positions = column_positions(one_hot_df, candidates)
+    return count_itemsets(bits, positions)
+
+
+def merge_partitions(
+        candidates: Sequence[Sequence[str]],
+        counts: Sequence[int],
+        n_rows: int,
+        min_support: float) -> pd.DataFrame:
+    """ Frequent itemsets from the counts of the candidates summed over
+        every partition, in eclat order over the sorted item names
+
+    Args:
+        candidates (Sequence[Sequence[str]]): The union of the locally
+            frequent itemsets of every partition as item names
+        counts (Sequence[int]): The transaction count of every candidate
+        n_rows (int): The number of transactions of every partition
+        min_support (float): The support threshold for generating
+            frequent itemsets.
+
+    Returns:
+        pd.DataFrame: The columns support and itemsets, in the same format
+            as fpgrowth with use_colnames=True.
+    """
+    if n_rows == 0:
+        return pd.DataFrame(columns=['support', 'itemsets'])
+    items = sorted({item for candidate in candidates for item in candidate})
+    position = {item: i for i, item in enumerate(items)}
+    min_singleton, min_count = min_counts(min_support, n_rows)
+    frequent = {
+        tuple(sorted(position[item] for item in candidate)): count
+        for candidate, count in zip(candidates, counts)
+        if count >= (min_singleton if len(candidate) == 1 else min_count)
+    }
+    order = eclat_order(frequent)
+    return pd.DataFrame({
+        'support': [frequent[itemset] / n_rows for itemset in order],
+        'itemsets': [
+            frozenset(items[i] for i in itemset) for itemset in order
+        ]
+    })
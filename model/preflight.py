@@ -0,0 +1,197 @@
+import math
+from collections import namedtuple
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from engines import MiningBudgetExceeded, eclat, min_counts, pack_matrix, \
+    rules_per_itemset
+from tuning import ITEMSET_BYTES, RULE_BYTES, basket_pair_counts
+
+Estimate = namedtuple('Estimate', [
+    'invoices',
+    'items',
+    'representation',
+    'matrix_bytes',
+    'mining_bytes',
+    'itemsets',
+    'rules',
+    'total_bytes'
+])
+
+# Invoices sampled and mined to estimate the frequent itemsets and rules
+SAMPLE_INVOICES = 5_000
+
+# The most itemsets and rules mined in the sample, which keeps the
+# preflight fast. Samples with more are estimated from their frequent
+# pairs instead, as at least this many.
+SAMPLE_MAX_ITEMSETS = 20_000
+SAMPLE_MAX_RULES = 200_000
+
+# Bytes per uploaded row while encoding: the invoice and item codes and
+# the quantity, held as COO and CSR at the same time
+ENCODE_BYTES_PER_ROW = 2 * 24
+
+# Bytes per basket entry of a pandas sparse boolean column and of an
+# fpgrowth tree node, and per cell of the dense 0/1 DataFrame
+SPARSE_BYTES_PER_ENTRY = 5
+FPGROWTH_BYTES_PER_ENTRY = 100
+DENSE_BYTES_PER_CELL = 8
+
+
+class JobTooLarge(ValueError):
+    """ A job is estimated to need more memory than a job may use """
+
+
+def expected_itemsets(
+        n_items: int,
+        pair_density: float) -> Tuple[float, float]:
+    """ Expected number of itemsets and rules when every frequent itemset
+        is a clique of frequent pairs, with pairs frequent at random. Real
+        baskets are far from random, so this is only a rough guess for
+        samples too large to mine.
+
+    Args:
+        n_items (int): The number of frequent items
+        pair_density (float): The fraction of pairs of frequent items that
+            are frequent
+
+    Returns:
+        Tuple[float, float]: The expected numbers of itemsets and rules.
+    """
+    itemsets = rules = 0.
+    log_density = math.log(pair_density) if pair_density > 0 else -math.inf
+    for size in range(1, n_items + 1):
+        log_count = (
+            math.lgamma(n_items + 1)
+            - math.lgamma(size + 1)
+            - math.lgamma(n_items - size + 1)
+        )
+        if size > 1:
+            log_count += size * (size - 1) / 2 * log_density
+        # Sizes past the peak only get less likely
+        if log_count < -50 and size > 2:
+            break
+        count = math.exp(min(log_count, 700))
+        itemsets += count
+        rules += count * rules_per_itemset(size)
+    return itemsets, rules
+
+
+def sample_counts(
+        sample: sparse.spmatrix,
+        min_support: float) -> Optional[Tuple[int, int]]:
+    """ The frequent itemsets and rules of a sample of baskets mined at
+        the support of the upload, which estimate those of the upload as
+        supports are fractions of the transactions
+
+    Returns:
+        Optional[Tuple[int, int]]: The numbers of itemsets and rules, or
+            None when there are more than SAMPLE_MAX_ITEMSETS or
+            SAMPLE_MAX_RULES.
+    """
+    min_singleton, min_count = min_counts(min_support, sample.shape[0])
+    try:
+        found = eclat(
+            pack_matrix(sample),
+            min_count=min_count,
+            min_singleton=min_singleton,
+            max_itemsets=SAMPLE_MAX_ITEMSETS,
+            max_rules=SAMPLE_MAX_RULES
+        )
+    except MiningBudgetExceeded:
+        return None
+    return len(found), sum(
+        rules_per_itemset(len(itemset)) for itemset, _ in found)
+
+
+def estimate_job(
+        n_rows: int,
+        n_invoices: int,
+        n_items: int,
+        sample: sparse.spmatrix,
+        min_support: Optional[float],
+        memory_budget: Optional[int] = None,
+        dense_cell_limit: Optional[int] = None) -> Estimate:
+    """ Estimate the memory of encoding and mining an upload, and pick the
+        representation of its basket matrix
+
+    Args:
+        n_rows (int): The number of uploaded rows
+        n_invoices (int): The number of distinct invoices
+        n_items (int): The number of distinct items
+        sample (sparse.spmatrix): The baskets of a sample of the invoices
+        min_support (Optional[float]): The support threshold, or None when
+            it is tuned to a budget and the itemsets are not estimated
+        memory_budget (int, optional): The bytes a job may use.
+            Defaults to None.
+        dense_cell_limit (int, optional): The most cells of a dense basket
+            matrix. Defaults to None.
+
+    Returns:
+        Estimate: The sizes of the basket matrix, the itemsets, and the
+            rules, the bytes needed by each stage, and the representation
+            of the basket matrix, 'dense' or 'sparse'.
+    """
+    cells = n_invoices * n_items
+    entries = min(n_rows, cells)
+    dense_bytes = cells * DENSE_BYTES_PER_CELL
+    sparse_bytes = entries * SPARSE_BYTES_PER_ENTRY
+    encode_bytes = n_rows * ENCODE_BYTES_PER_ROW
+    mining_bytes = max(
+        n_items * ((n_invoices + 7) // 8),
+        entries * FPGROWTH_BYTES_PER_ENTRY
+    )
+
+    itemsets = rules = None
+    if min_support is not None and sample.shape[0]:
+        counts = sample_counts(sample, min_support)
+        if counts is not None:
+            itemsets, rules = counts
+        else:
+            singles, pairs = basket_pair_counts(sample)
+            min_singleton, min_count = min_counts(
+                min_support, sample.shape[0])
+            frequent_items = int(np.count_nonzero(singles >= min_singleton))
+            frequent_pairs = int(np.count_nonzero(pairs >= min_count))
+            possible_pairs = frequent_items * (frequent_items - 1) / 2
+            itemsets, rules = expected_itemsets(
+                frequent_items,
+                frequent_pairs / possible_pairs if possible_pairs else 0.
+            )
+            itemsets = max(itemsets, SAMPLE_MAX_ITEMSETS)
+            rules = max(rules, SAMPLE_MAX_RULES)
+        mining_bytes += int(min(
+            itemsets * ITEMSET_BYTES + rules * RULE_BYTES,
+            np.iinfo(np.int64).max // 2
+        ))
+
+    def total(matrix_bytes: int) -> int:
+        return max(encode_bytes, matrix_bytes + mining_bytes)
+
+    representation, matrix_bytes = 'sparse', sparse_bytes
+    if (dense_cell_limit is None or cells <= dense_cell_limit) and (
+            memory_budget is None or total(dense_bytes) <= memory_budget):
+        representation, matrix_bytes = 'dense', dense_bytes
+    return Estimate(
+        invoices=n_invoices,
+        items=n_items,
+        representation=representation,
+        matrix_bytes=matrix_bytes,
+        mining_bytes=mining_bytes,
+        itemsets=None if itemsets is None else int(min(itemsets, 2 ** 62)),
+        rules=None if rules is None else int(min(rules, 2 ** 62)),
+        total_bytes=total(matrix_bytes)
+    )
+
+
+def check_estimate(estimate: Estimate, memory_budget: Optional[int]) -> None:
+    """ Raise JobTooLarge when a job needs more memory than its budget """
+    if memory_budget is not None and estimate.total_bytes > memory_budget:
+        raise JobTooLarge(
+            f'The upload of {estimate.invoices} invoices and '
+            f'{estimate.items} items needs about '
+            f'{estimate.total_bytes / 2 ** 20:,.0f} MB to mine, more than '
+            f'the {memory_budget / 2 ** 20:,.0f} MB a job may use. Upload '
+            'fewer transactions or raise the minimum support.')
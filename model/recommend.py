@@ -0,0 +1,393 @@
+""" Recommend items to baskets from association rules
+
+Run this module to score a file of baskets offline:
+
+    python model/recommend.py rules.arrow baskets.csv recommendations.parquet
+"""
+import argparse
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from artifacts import ITEMSET_COLUMNS
+
+# Baskets matched against the rules at a time by recommend_baskets
+BASKET_BATCH = 20_000
+
+
+def itemset_ids(
+        itemsets: Sequence[frozenset],
+        item_ids: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Itemsets as the item ids of every itemset concatenated, and the
+        offsets of every itemset into them (CSR)
+    """
+    sizes = np.fromiter(
+        (len(itemset) for itemset in itemsets), dtype=np.int64,
+        count=len(itemsets))
+    offsets = np.zeros(len(itemsets) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    ids = np.fromiter(
+        (item_ids[str(item).strip()] for itemset in itemsets
+         for item in itemset),
+        dtype=np.int64, count=int(offsets[-1]))
+    return ids, offsets
+
+
+def gather(ids: np.ndarray, offsets: np.ndarray,
+           rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ The ids of some rows of a CSR array, and the row of every id """
+    starts = offsets[rows]
+    sizes = offsets[rows + 1] - starts
+    ends = np.cumsum(sizes)
+    positions = np.arange(ends[-1] if len(ends) else 0) \
+        - np.repeat(ends - sizes, sizes) + np.repeat(starts, sizes)
+    return ids[positions], np.repeat(rows, sizes)
+
+
+class RecommendIndex:
+    """ Association rules compiled for recommending items to baskets
+
+    Items are numbered by name. The antecedents of the rules are kept as
+    arrays of item ids, with an inverted index from every item to the
+    rules whose antecedent contains it. A basket fires the rules whose
+    every antecedent item it holds: the rules found through the inverted
+    index as many times as their antecedent has items.
+    """
+
+    def __init__(self, rules: pd.DataFrame):
+        rules = rules.reset_index(drop=True)
+        antecedents = rules['antecedents'].tolist()
+        consequents = rules['consequents'].tolist()
+        self.items = sorted({
+            str(item).strip()
+            for itemsets in (antecedents, consequents)
+            for itemset in itemsets for item in itemset
+        })
+        self.item_ids = {item: i for i, item in enumerate(self.items)}
+        self.metrics = [
+            name for name in rules.columns
+            if name not in ITEMSET_COLUMNS
+            and pd.api.types.is_numeric_dtype(rules[name])
+        ]
+        self._values = {
+            name: rules[name].to_numpy(dtype=float) for name in self.metrics
+        }
+        self._orders: Dict[str, np.ndarray] = {}
+
+        self._antecedents = itemset_ids(antecedents, self.item_ids)
+        self._consequents = itemset_ids(consequents, self.item_ids)
+        ids, offsets = self._antecedents
+        self._antecedent_sizes = np.diff(offsets)
+
+        # Rules by antecedent item, also as CSR
+        order = np.argsort(ids, kind='stable')
+        self._postings = np.repeat(
+            np.arange(len(rules.index)), self._antecedent_sizes)[order]
+        self._posting_offsets = np.searchsorted(
+            ids[order], np.arange(len(self.items) + 1))
+
+    def __len__(self) -> int:
+        return len(self._antecedent_sizes)
+
+    def order(self, metric: str) -> np.ndarray:
+        """ Rules by a metric, highest first and missing values last """
+        if metric not in self._orders:
+            self._orders[metric] = np.argsort(
+                -self._values[metric], kind='stable')
+        return self._orders[metric]
+
+    def basket_ids(self, basket: Iterable[str]) -> np.ndarray:
+        """ Sorted ids of the items of a basket that appear in any rule """
+        return np.unique(np.array([
+            self.item_ids[item] for item in map(str.strip, map(str, basket))
+            if item in self.item_ids
+        ], dtype=np.int64))
+
+    def fired(self, ids: np.ndarray) -> np.ndarray:
+        """ The rules whose antecedent is a subset of the item ids """
+        if not len(ids):
+            return np.empty(0, dtype=np.int64)
+        rules, _ = gather(self._postings, self._posting_offsets, ids)
+        rules, hits = np.unique(rules, return_counts=True)
+        return rules[hits == self._antecedent_sizes[rules]]
+
+    def recommend(
+            self,
+            basket: Iterable[str],
+            metric: str = 'confidence',
+            n: int = 10) -> List[dict]:
+        """ Items to recommend to a basket, from the rules it fires
+
+        Args:
+            basket (Iterable[str]): The items of the basket
+            metric (str, optional): One of metrics, ranking the rules.
+                Defaults to 'confidence'.
+            n (int, optional): The most items recommended. Defaults to 10.
+
+        Raises:
+            KeyError: metric is not a metric of the rules
+
+        Returns:
+            List[dict]: The n consequent items not in the basket with the
+                highest metric of a fired rule, highest first. Every item
+                has its score and the antecedents of that rule.
+        """
+        values = self._values[metric]
+        ids = self.basket_ids(basket)
+        rules = self.fired(ids)
+        items, rules = gather(*self._consequents, rules)
+        scores = values[rules]
+        keep = ~np.isin(items, ids) & ~np.isnan(scores)
+        items, rules, scores = items[keep], rules[keep], scores[keep]
+
+        # The best rule of every item, then the best items
+        order = np.argsort(-scores, kind='stable')
+        _, first = np.unique(items[order], return_index=True)
+        best = order[np.sort(first)][:n]
+
+        antecedent_ids, antecedent_offsets = self._antecedents
+        recommendations = []
+        for item, rule, score in zip(
+                items[best].tolist(), rules[best].tolist(),
+                scores[best].tolist()):
+            because = antecedent_ids[
+                antecedent_offsets[rule]:antecedent_offsets[rule + 1]]
+            recommendations.append({
+                'item': self.items[item],
+                metric: score if np.isfinite(score) else None,
+                'antecedents': [self.items[i] for i in because.tolist()]
+            })
+        return recommendations
+
+    def item_rules(self, items: Sequence[str]) -> sparse.csr_matrix:
+        """ Which antecedents hold the item of every column of a basket
+            matrix
+
+        Args:
+            items (Sequence[str]): The items of the columns
+
+        Returns:
+            sparse.csr_matrix: An int32 items x rules matrix. The product of
+                a basket matrix and it counts the antecedent items of every
+                rule in every basket.
+        """
+        ids, offsets = self._antecedents
+        antecedents = sparse.csc_matrix(
+            (np.ones(len(ids), dtype=np.int32), ids, offsets),
+            shape=(len(self.items), len(self))
+        )
+        return (self.column_items(items) @ antecedents).tocsr()
+
+    def column_ids(self, items: Sequence[str]) -> Tuple[np.ndarray,
+                                                        np.ndarray]:
+        """ The columns of items that appear in any rule, and their ids """
+        ids = np.array([
+            self.item_ids.get(str(item).strip(), -1) for item in items
+        ], dtype=np.int64)
+        columns = np.flatnonzero(ids >= 0)
+        return columns, ids[columns]
+
+    def column_items(self, items: Sequence[str]) -> sparse.csr_matrix:
+        """ A 0/1 columns x item ids matrix mapping the columns of a basket
+            matrix to the items of the rules
+        """
+        columns, ids = self.column_ids(items)
+        return sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.int32), (columns, ids)),
+            shape=(len(items), len(self.items))
+        )
+
+    def score_baskets(
+            self,
+            baskets: sparse.csr_matrix,
+            column_rules: sparse.csr_matrix,
+            column_items: sparse.csr_matrix,
+            metric: str = 'confidence',
+            n: int = 10) -> Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                  np.ndarray]:
+        """ recommend for every row of a basket matrix at once
+
+        Args:
+            baskets (sparse.csr_matrix): A baskets x items 0/1 matrix
+            column_rules (sparse.csr_matrix): item_rules of its columns
+            column_items (sparse.csr_matrix): column_items of its columns
+            metric (str, optional): One of metrics, ranking the rules.
+                Defaults to 'confidence'.
+            n (int, optional): The most items recommended to each basket.
+                Defaults to 10.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The
+                basket, rank from 0, item id, and score of every
+                recommendation, by basket and rank.
+        """
+        order = self.order(metric)
+        rule_rank = np.empty_like(order)
+        rule_rank[order] = np.arange(len(order))
+        baskets = sparse.csr_matrix(baskets, dtype=np.int32)
+        hits = baskets @ column_rules
+        basket_of_hit = np.repeat(
+            np.arange(hits.shape[0]), np.diff(hits.indptr))
+        fired = hits.data == self._antecedent_sizes[hits.indices]
+        rules, basket_of_rule = hits.indices[fired], basket_of_hit[fired]
+
+        items, rule_of_item = gather(*self._consequents, rules)
+        basket_of_item = np.repeat(
+            basket_of_rule, np.diff(self._consequents[1])[rules])
+
+        # Drop the items already in the basket and rules without a score
+        n_items, n_rules = len(self.items), len(self)
+        held = baskets @ column_items
+        held_keys = np.repeat(
+            np.arange(held.shape[0]), np.diff(held.indptr)) * n_items \
+            + held.indices
+        keys = basket_of_item * n_items + items
+        keep = ~np.isin(keys, held_keys) \
+            & ~np.isnan(self._values[metric][rule_of_item])
+
+        # Sorting packed integers rather than lexsort keeps this fast.
+        # First the best rule of every basket and item...
+        packed = np.sort(keys[keep] * n_rules + rule_rank[rule_of_item[keep]])
+        keys, ranks = np.divmod(packed, n_rules)
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        basket, items = np.divmod(keys[first], n_items)
+        # ...then the best items of every basket
+        packed = np.sort(
+            (basket * n_rules + ranks[first]) * n_items + items)
+        rest, items = np.divmod(packed, n_items)
+        basket, ranks = np.divmod(rest, n_rules)
+        starts = np.flatnonzero(np.r_[True, basket[1:] != basket[:-1]]) \
+            if len(basket) else np.empty(0, np.int64)
+        rank = np.arange(len(basket)) - np.repeat(
+            starts, np.diff(np.r_[starts, len(basket)]))
+        top = rank < n
+        scores = self._values[metric][order[ranks[top]]]
+        return basket[top], rank[top], items[top], scores
+
+
+def recommend_baskets(
+        index: RecommendIndex,
+        baskets: sparse.csr_matrix,
+        invoices: Sequence,
+        items: Sequence[str],
+        metric: str = 'confidence',
+        n: int = 10,
+        batch: int = BASKET_BATCH) -> Iterator[pd.DataFrame]:
+    """ Recommendations for every basket of a basket matrix, a batch of
+        baskets at a time
+
+    Args:
+        index (RecommendIndex): The rules
+        baskets (sparse.csr_matrix): A baskets x items 0/1 matrix such as
+            the output of apriori.encode_baskets
+        invoices (Sequence): The basket of every row
+        items (Sequence[str]): The item of every column
+        metric (str, optional): One of metrics, ranking the rules.
+            Defaults to 'confidence'.
+        n (int, optional): The most items recommended to each basket.
+            Defaults to 10.
+        batch (int, optional): The baskets scored at a time.
+            Defaults to BASKET_BATCH.
+
+    Yields:
+        Iterator[pd.DataFrame]: The columns InvoiceNo, rank (from 1),
+            item, and metric, by basket and rank.
+    """
+    if metric not in index.metrics:
+        raise KeyError(metric)
+    baskets = sparse.csr_matrix(baskets)
+    invoices = np.asarray(invoices)
+    item_names = np.array(index.items, dtype=object)
+    column_rules = index.item_rules(items)
+    column_items = index.column_items(items)
+    for start in range(0, baskets.shape[0], batch):
+        rows, rank, item_ids, scores = index.score_baskets(
+            baskets[start:start + batch],
+            column_rules,
+            column_items,
+            metric,
+            n
+        )
+        yield pd.DataFrame({
+            'InvoiceNo': invoices[start + rows],
+            'rank': rank + 1,
+            'item': item_names[item_ids],
+            metric: scores
+        })
+
+
+def write_recommendations(
+        frames: Iterable[pd.DataFrame],
+        path: str) -> int:
+    """ Stream recommendations to a .csv or .parquet file as they are
+        scored
+
+    Args:
+        frames (Iterable[pd.DataFrame]): The output of recommend_baskets
+        path (str): The file written, its extension picks the format
+
+    Returns:
+        int: The number of recommendations written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    extension = os.path.splitext(path.lower())[1]
+    if extension not in ('.csv', '.parquet'):
+        raise ValueError(
+            f"Unsupported file type '{extension}'. Must be .csv or .parquet.")
+    written = 0
+    writer = None
+    try:
+        for frame in frames:
+            if extension == '.csv':
+                frame.to_csv(path, mode='a' if written else 'w',
+                             header=not written, index=False)
+            else:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            written += len(frame.index)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def main(argv: Sequence[str]) -> None:
+    from apriori import encode_baskets, read_input_data
+    from artifacts import read_rules
+
+    parser = argparse.ArgumentParser(
+        description='Recommend items to every basket of a file of '
+                    'transactions.')
+    parser.add_argument('rules', help='Arrow file of rules, see '
+                                      'artifacts.write_rules')
+    parser.add_argument('baskets', help='.csv, .xls, or .xlsx file with '
+                                        'InvoiceNo, Description, Quantity')
+    parser.add_argument('output', help='.csv or .parquet file written')
+    parser.add_argument('--metric', default='confidence')
+    parser.add_argument('-n', type=int, default=10)
+    args = parser.parse_args(argv)
+    if not args.output.lower().endswith(('.csv', '.parquet')):
+        parser.error('output must be a .csv or .parquet file')
+
+    index = RecommendIndex(read_rules(args.rules))
+    baskets, invoices, items = encode_baskets(read_input_data(args.baskets))
+    written = write_recommendations(
+        recommend_baskets(index, baskets, invoices, items, args.metric,
+                          args.n),
+        args.output
+    )
+    print(f'{written} recommendations for {len(invoices)} baskets written '
+          f'to {args.output}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,202 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from engines import MiningBudgetExceeded, get_engine, rules_per_itemset
+
+# Rough memory of one rule in the rules table and its metric views, and
+# of one frequent itemset, used to turn a memory budget into counts
+RULE_BYTES = 1024
+ITEMSET_BYTES = 256
+
+# Pairs are only counted among this many of the most frequent items
+PAIR_ITEMS = 1000
+
+# The most mining runs of the search for the lowest support that fits.
+# Each run stops as soon as it exceeds the budget.
+TUNING_ROUNDS = 20
+
+
+def budget_counts(
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None,
+        max_bytes: Optional[int] = None) -> Tuple[Optional[int],
+                                                  Optional[int]]:
+    """ The itemset and rule budgets, with a memory budget applied to both
+
+    Args:
+        max_itemsets (int, optional): The most frequent itemsets allowed.
+            Defaults to None.
+        max_rules (int, optional): The most rules allowed. Defaults to None.
+        max_bytes (int, optional): The memory allowed for itemsets and
+            rules. Defaults to None.
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: The most itemsets and rules
+            allowed, None where there is no limit.
+    """
+    if max_bytes is not None:
+        max_itemsets = min(max_itemsets or np.inf, max_bytes // ITEMSET_BYTES)
+        max_rules = min(max_rules or np.inf, max_bytes // RULE_BYTES)
+    return max_itemsets, max_rules
+
+
+def pair_counts(one_hot_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """ Transaction counts of every item and of the pairs of the most
+        frequent items
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The counts of single items and the
+            nonzero counts of pairs of the PAIR_ITEMS most frequent items.
+    """
+    if hasattr(one_hot_df, 'sparse'):
+        baskets = one_hot_df.sparse.to_coo()
+    else:
+        baskets = sparse.csc_matrix(one_hot_df.to_numpy())
+    return basket_pair_counts(baskets)
+
+
+def basket_pair_counts(
+        baskets: sparse.spmatrix) -> Tuple[np.ndarray, np.ndarray]:
+    """ pair_counts of a sparse transaction x item matrix """
+    baskets = (sparse.csc_matrix(baskets) != 0).astype(np.int32)
+    singles = np.asarray(baskets.sum(axis=0)).ravel()
+    top = np.argsort(singles)[::-1][:PAIR_ITEMS]
+    top_baskets = baskets[:, np.sort(top)]
+    pairs = sparse.triu(top_baskets.T @ top_baskets, k=1)
+    return singles, pairs.data
+
+
+def estimate_counts(
+        singles: np.ndarray,
+        pairs: np.ndarray,
+        min_count: int) -> Tuple[int, int]:
+    """ Lower bounds of the itemsets and rules at a minimum count, from the
+        single items and pairs alone
+    """
+    n_pairs = int(np.count_nonzero(pairs >= min_count))
+    n_itemsets = int(np.count_nonzero(singles >= min_count)) + n_pairs
+    return n_itemsets, n_pairs * rules_per_itemset(2)
+
+
+def support_thresholds(
+        singles: np.ndarray,
+        pairs: np.ndarray,
+        n_rows: int) -> np.ndarray:
+    """ Candidate minimum counts in ascending order. Supports between two
+        observed counts of single items or pairs rarely find different
+        itemsets, so only the observed counts are searched.
+    """
+    thresholds = np.unique(np.concatenate([singles, pairs, [n_rows]]))
+    return thresholds[thresholds > 0]
+
+
+def lowest_estimate(
+        singles: np.ndarray,
+        pairs: np.ndarray,
+        thresholds: np.ndarray,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None) -> int:
+    """ Binary search for the lowest threshold whose single items and
+        pairs fit the budget. Lower thresholds cannot fit.
+
+    Returns:
+        int: An index into thresholds.
+    """
+    def fits(min_count: int) -> bool:
+        n_itemsets, n_rules = estimate_counts(singles, pairs, min_count)
+        return (max_itemsets is None or n_itemsets <= max_itemsets) \
+            and (max_rules is None or n_rules <= max_rules)
+
+    low, high = 0, len(thresholds) - 1
+    if not fits(thresholds[high]):
+        raise MiningBudgetExceeded(
+            'Even the most frequent items exceed the mining budget.')
+    while low < high:
+        middle = (low + high) // 2
+        if fits(thresholds[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def tune_min_support(
+        one_hot_df: pd.DataFrame,
+        max_itemsets: Optional[int] = None,
+        max_rules: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        engine: str = 'auto') -> Tuple[float, pd.DataFrame, str]:
+    """ Mine at the lowest support that fits a budget of itemsets, rules,
+        or memory
+
+    The counts of single items and pairs give the lowest support that can
+    fit. Larger itemsets may still exceed the budget, so the support is
+    then found by a binary search in which every mining run stops as soon
+    as it exceeds the budget.
+
+    Args:
+        one_hot_df (pd.DataFrame): a one hot encoded DataFrame with
+            rows as InvoiceNos and columns as Descriptions
+        max_itemsets (int, optional): The most frequent itemsets allowed.
+            Defaults to None.
+        max_rules (int, optional): The most rules allowed. Defaults to None.
+        max_bytes (int, optional): The memory allowed for itemsets and
+            rules. Defaults to None.
+        engine (str, optional): The frequent itemset engine. 'auto' uses
+            'bitset', which stops as soon as it exceeds the budget.
+            Defaults to 'auto'.
+
+    Raises:
+        MiningBudgetExceeded: No support tried fits the budget.
+
+    Returns:
+        Tuple[float, pd.DataFrame, str]: The support, the frequent
+            itemsets found with it, and the name of the engine.
+    """
+    max_itemsets, max_rules = budget_counts(max_itemsets, max_rules, max_bytes)
+    if max_itemsets is None and max_rules is None:
+        raise ValueError('Tuning the minimum support needs a budget.')
+    n_rows = len(one_hot_df.index)
+    if n_rows == 0:
+        return 1.0, pd.DataFrame(columns=['support', 'itemsets']), engine
+    singles, pairs = pair_counts(one_hot_df)
+    thresholds = support_thresholds(singles, pairs, n_rows)
+    low = lowest_estimate(singles, pairs, thresholds, max_itemsets,
+                          max_rules)
+    high = len(thresholds) - 1
+    # fpgrowth only checks the budget once it finishes
+    if engine == 'auto':
+        engine = 'bitset'
+    engine, find_itemsets = get_engine(engine, one_hot_df)
+
+    best = None
+    # The estimate is usually right, so it is tried first
+    middle = low
+    for _ in range(TUNING_ROUNDS):
+        if low > high:
+            break
+        min_support = float(thresholds[middle]) / n_rows
+        try:
+            itemsets = find_itemsets(
+                one_hot_df,
+                min_support,
+                max_itemsets=max_itemsets,
+                max_rules=max_rules
+            )
+            best = min_support, itemsets, engine
+            high = middle - 1
+        except MiningBudgetExceeded:
+            low = middle + 1
+        middle = (low + high) // 2
+    if best is None:
+        raise MiningBudgetExceeded(
+            f'No minimum support up to {min_support:.4g} fits the mining '
+            'budget.')
+    return best
@@ -1,16 +1,60 @@
-import matplotlib
-matplotlib.use('Agg')
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import networkx as nx
-import plotly
-import plotly.graph_objects as go
 import json
 
-from addEdge import addEdge
+from addEdge import add_edges
+
+# Plotting libraries are imported by the functions that plot, so that
+# processes which never plot, such as Celery workers, do not load them
+
+# Rules drawn in the network graph, those with the highest metric first.
+# 0 draws every rule.
+NETWORK_MAX_EDGES = int(os.environ.get('NETWORK_MAX_EDGES', 0)) or None
+
+# Antecedents and consequents shown by the heatmap, those with the highest
+# metric. 0 shows every itemset.
+HEATMAP_MAX_ITEMS = int(os.environ.get('HEATMAP_MAX_ITEMS', 50)) or None
+HEATMAP_DECIMALS = 4
+
+# Graphs with more nodes than this are laid out with the faster layout by
+# the 'auto' layout, and traces with more points than this use WebGL
+FAST_LAYOUT_NODES = 500
+WEBGL_POINTS = 5_000
+
+# Layouts of the rule sets most recently drawn in this process
+LAYOUT_CACHE_SIZE = 64
+
+# Components with fewer nodes than this are placed on a circle instead of
+# with the layout of the graph, which cannot place a single edge usefully
+MIN_LAYOUT_NODES = 3
+
+# networkx layout functions and their arguments
+LAYOUTS = {
+    'spring': ('spring_layout', {'k': 0.5, 'seed': 0}),
+    'spectral': ('spectral_layout', {}),
+    'circular': ('circular_layout', {})
+}
+
+
+def itemset_labels(itemsets: pd.Series) -> pd.Series:
+    """ Comma separated labels of itemsets, joined once per distinct itemset
+
+    Args:
+        itemsets (pd.Series): frozensets of items
+
+    Returns:
+        pd.Series: The sorted items of every itemset joined by commas.
+    """
+    codes, uniques = pd.factorize(itemsets)
+    labels = np.array(
+        [','.join(sorted(map(str, itemset))).strip() for itemset in uniques],
+        dtype=object
+    )
+    return pd.Series(labels[codes], index=itemsets.index, dtype=object)
 
 
 def remove_frozensets(rules: pd.DataFrame) -> pd.DataFrame:
@@ -21,22 +65,68 @@ def remove_frozensets(rules: pd.DataFrame) -> pd.DataFrame:
             with association_rules function of mlxtend
 
     Returns:
-        pd.DataFrame: DataFrame with antecendents and consequents columns
-            of type list.
+        pd.DataFrame: A copy of the rules with antecendents_ and
+            consequents_ columns of comma separated items.
     """
-    rules['antecedents_'] = rules['antecedents'].apply(
-        lambda a: ','.join(list(a))
+    return rules.assign(
+        antecedents_=itemset_labels(rules['antecedents']),
+        consequents_=itemset_labels(rules['consequents'])
     )
-    rules['consequents_'] = rules['consequents'].apply(
-        lambda a: ','.join(list(a))
-    )
-    rules['antecedents_'] = rules['antecedents_'].str.strip()
-    rules['consequents_'] = rules['consequents_'].str.strip()
 
-    return rules
 
+def top_codes(codes: np.ndarray, values: np.ndarray, n_codes: int,
+              k: Optional[int]) -> np.ndarray:
+    """ The k codes with the highest maximum value, highest first """
+    best = np.full(n_codes, -np.inf)
+    np.fmax.at(best, codes, values)
+    order = np.argsort(-best, kind='stable')
+    return order if k is None else order[:k]
+
+
+def heatmap_matrix(
+        rules: pd.DataFrame,
+        plot_val: str,
+        max_items: Optional[int] = None) -> Tuple[list, list, np.ndarray]:
+    """ Pivot the rules into a consequent x antecedent matrix of a metric,
+        keeping the itemsets with the highest metric
+
+    Args:
+        rules (pd.DataFrame): association rules from mlxtend
+        plot_val (str): The metric of the matrix
+        max_items (int, optional): The most antecedents and the most
+            consequents kept. Defaults to None, which keeps every itemset.
+
+    Returns:
+        Tuple[list, list, np.ndarray]: The antecedent labels, the
+            consequent labels, and the highest metric of the rules between
+            them, NaN where there is no rule.
+    """
+    values = rules[plot_val].to_numpy(dtype=float)
+    antecedents, antecedent_sets = pd.factorize(rules['antecedents'])
+    consequents, consequent_sets = pd.factorize(rules['consequents'])
+    columns = top_codes(antecedents, values, len(antecedent_sets), max_items)
+    rows = top_codes(consequents, values, len(consequent_sets), max_items)
+
+    # Positions of the kept itemsets in the matrix, -1 for the rest
+    column_of = np.full(len(antecedent_sets), -1)
+    column_of[columns] = np.arange(len(columns))
+    row_of = np.full(len(consequent_sets), -1)
+    row_of[rows] = np.arange(len(rows))
+    column, row = column_of[antecedents], row_of[consequents]
+    kept = (column >= 0) & (row >= 0)
+
+    z = np.full((len(rows), len(columns)), np.nan)
+    np.fmax.at(z, (row[kept], column[kept]), values[kept])
+    x = itemset_labels(pd.Series(antecedent_sets[columns], dtype=object))
+    y = itemset_labels(pd.Series(consequent_sets[rows], dtype=object))
+    return x.tolist(), y.tolist(), z
 
-def plot_heatmap_plotly(rules: pd.DataFrame, plot_val: str, show: bool = True) -> None:
+
+def plot_heatmap_plotly(
+        rules: pd.DataFrame,
+        plot_val: str,
+        show: bool = True,
+        max_items: Optional[int] = HEATMAP_MAX_ITEMS) -> None:
     """ Plot an interactive heatmap
 
     Args:
@@ -44,25 +134,38 @@ def plot_heatmap_plotly(rules: pd.DataFrame, plot_val: str, show: bool = True) -
         plot_val (str): The metric to use for the heatmap such as
             confidence, lift, or leverage
         show (bool): Whether to show the plot. If False, return a JSONObject
+        max_items (int, optional): The most antecedents and consequents
+            shown, those with the highest metric. Defaults to
+            HEATMAP_MAX_ITEMS.
     """
-    rules = remove_frozensets(rules)
+    import plotly.graph_objects as go
 
-    fig = go.Figure(data=go.Heatmap(
-        x=rules['antecedents_'],
-        y=rules['consequents_'],
-        z=rules[plot_val],
+    x, y, z = heatmap_matrix(rules, plot_val, max_items)
+    heatmap = dict(
+        type='heatmap',
+        x=x,
+        y=y,
+        z=np.where(
+            np.isfinite(z), z.round(HEATMAP_DECIMALS), None
+        ).tolist(),
         hoverongaps=False
-    ))
-
-    fig.update_layout(
+    )
+    fig = go.Figure(layout=dict(
         title=f'{plot_val}'.title(),
         xaxis_title='Antecedents',
         yaxis_title='Consequents'
-    )
+    ))
     if show:
+        fig.add_trace(heatmap)
         fig.show()
     else:
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        # The trace holds only lists of floats, strings and None, so it is
+        # encoded directly rather than validated by Plotly
+        return json.dumps(
+            {'data': [heatmap], 'layout': fig.to_plotly_json()['layout']},
+            separators=(',', ':'),
+            allow_nan=False
+        )
 
 
 def plot_heatmap_seaborn(rules: pd.DataFrame, plot_val: str) -> None:
@@ -73,6 +176,11 @@ def plot_heatmap_seaborn(rules: pd.DataFrame, plot_val: str) -> None:
         plot_val (str): The metric to use for the heatmap such as
             confidence, lift, or leverage
     """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     rules = remove_frozensets(rules)
     pivot = rules.pivot(
         index='antecedents_',
@@ -89,7 +197,83 @@ def plot_heatmap_seaborn(rules: pd.DataFrame, plot_val: str) -> None:
     plt.show()
 
 
-def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool = True) -> None:
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def network_layout(
+        edges: Tuple[Tuple[str, str], ...],
+        layout: str = 'auto') -> Dict[str, np.ndarray]:
+    """ Positions of the items of a rule set, computed once per process for
+        every set of edges. The returned dict is shared, so do not modify it.
+
+    Args:
+        edges (Tuple[Tuple[str, str], ...]): The antecedents and consequents
+            of every rule
+        layout (str, optional): One of LAYOUTS, or 'auto' for 'spring' up to
+            FAST_LAYOUT_NODES nodes and 'spectral' above.
+            Defaults to 'auto'.
+
+    Returns:
+        Dict[str, np.ndarray]: The position of every node.
+    """
+    import networkx as nx
+
+    G = nx.DiGraph(edges)
+    if layout == 'auto':
+        layout = 'spring' if len(G) <= FAST_LAYOUT_NODES else 'spectral'
+    if layout not in LAYOUTS:
+        raise ValueError(f'Unknown layout {layout!r}, expected one of '
+                         f'{", ".join(LAYOUTS)} or auto.')
+    name, kwargs = LAYOUTS[layout]
+    return tile_components(G, getattr(nx, name), kwargs)
+
+
+def tile_components(G, layout_function, kwargs: dict) -> Dict[str, np.ndarray]:
+    """ Lay out every weakly connected component of a graph on its own and
+        place them on a grid, largest first. Layouts such as spectral_layout
+        would otherwise put every component on top of the others.
+
+    Args:
+        G (nx.DiGraph): The graph
+        layout_function (Callable): A networkx layout function
+        kwargs (dict): Its arguments
+
+    Returns:
+        Dict[str, np.ndarray]: The position of every node, with components
+            scaled by the square root of their size into cells of size 1.
+    """
+    import networkx as nx
+
+    components = sorted(
+        nx.weakly_connected_components(G),
+        key=len,
+        reverse=True
+    )
+    if len(components) <= 1:
+        return layout_function(G, **kwargs)
+    columns = int(np.ceil(np.sqrt(len(components))))
+    largest = len(components[0])
+    positions = {}
+    for i, nodes in enumerate(components):
+        subgraph = G.subgraph(nodes)
+        if len(nodes) < MIN_LAYOUT_NODES:
+            component = nx.circular_layout(subgraph)
+        else:
+            component = layout_function(subgraph, **kwargs)
+        coords = np.array(list(component.values()), dtype=float)
+        coords -= coords.mean(axis=0)
+        extent = np.abs(coords).max()
+        if extent > 0:
+            coords *= 0.45 * np.sqrt(len(nodes) / largest) / extent
+        coords += (i % columns, -(i // columns))
+        positions.update(zip(component, coords))
+    return positions
+
+
+def plot_network_graph_plotly(
+        rules: pd.DataFrame,
+        weight_var: str,
+        show: bool = True,
+        max_edges: Optional[int] = NETWORK_MAX_EDGES,
+        layout: str = 'auto') -> None:
     """ Create a network of items and rules where edges contain
     various scores such as confidence, lift, etc.
 
@@ -98,7 +282,18 @@ def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool =
         weight_var (str): the association metric to use. Must be one of
             'confidence', 'lift', 'leverage', or 'conviction'.
         show (bool): whether to show the plot. If False, return a JSONObject.
+        max_edges (int, optional): draw only the rules with the highest
+            weight_var. Defaults to NETWORK_MAX_EDGES.
+        layout (str, optional): the layout of the nodes, see network_layout.
+            Defaults to 'auto'.
     """
+    import networkx as nx
+    import plotly
+    import plotly.graph_objects as go
+
+    pruned = max_edges is not None and len(rules.index) > max_edges
+    if pruned:
+        rules = rules.nlargest(max_edges, weight_var)
     rules = remove_frozensets(rules)
     rules[f'{weight_var}'] = rules[f'{weight_var}'].round(2)
 
@@ -109,30 +304,18 @@ def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool =
         edge_attr=f'{weight_var}',
         create_using=nx.DiGraph
     )
-    pos = nx.spring_layout(G1, k=0.5)
-    for n, p in pos.items():
-        G1.nodes[n]['pos'] = p
-
-    xmids = []
-    ymids = []
-    edge_x = []
-    edge_y = []
-
-    for edge in G1.edges():
-        x0, y0 = G1.nodes[edge[0]]['pos']
-        x1, y1 = G1.nodes[edge[1]]['pos']
-        xmids.append((x0 + x1)/2)
-        ymids.append((y0 + y1)/2)
-        edge_x, edge_y = addEdge(
-            start=(x0, y0),
-            end=(x1, y1),
-            edge_x=edge_x,
-            edge_y=edge_y,
-            arrowPos='end',
-            arrowLength=0.04
-        )
+    edges = tuple(G1.edges())
+    pos = network_layout(edges, layout)
 
-    edge_trace = go.Scatter(
+    starts = np.array([pos[u] for u, _ in edges]).reshape(-1, 2)
+    ends = np.array([pos[v] for _, v in edges]).reshape(-1, 2)
+    mids = (starts + ends) / 2
+    edge_x, edge_y = add_edges(starts, ends, arrowPos='end', arrowLength=0.04)
+
+    # SVG traces slow the browser down with many points
+    Scatter = go.Scattergl if len(edge_x) > WEBGL_POINTS else go.Scatter
+
+    edge_trace = Scatter(
         x=edge_x,
         y=edge_y,
         line=dict(width=1.5, color='#888'),
@@ -143,18 +326,19 @@ def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool =
     etext = [f'{weight_var}: {w}' for w in
              list(nx.get_edge_attributes(G1, f'{weight_var}').values())]
 
-    eweights_trace = go.Scatter(
-        x=xmids,
-        y=ymids,
+    eweights_trace = Scatter(
+        x=mids[:, 0],
+        y=mids[:, 1],
         mode='markers',
         marker=dict(color='rgb(125,125,125)', size=1),
         text=etext,
         hoverinfo='text'
     )
 
-    node_trace = go.Scatter(
-        x=[],
-        y=[],
+    nodes = np.array([pos[n] for n in G1.nodes]).reshape(-1, 2)
+    node_trace = Scatter(
+        x=nodes[:, 0],
+        y=nodes[:, 1],
         text=list(G1.nodes),
         mode='markers',
         hoverinfo='text',
@@ -162,11 +346,6 @@ def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool =
         marker_color='#000080'
     )
 
-    for node in G1.nodes():
-        x, y = G1.nodes[node]['pos']
-        node_trace['x'] += tuple([x])
-        node_trace['y'] += tuple([y])
-
     fig = go.Figure(
         data=[edge_trace, node_trace, eweights_trace],
         layout=go.Layout(
@@ -186,6 +365,8 @@ def plot_network_graph_plotly(rules: pd.DataFrame, weight_var: str, show: bool =
              f' Hover over edge arrow between'
              f' nodes to get {weight_var} score<br>'
              f' Arrow represents rule A &#8594; C'
+             + (f'<br> Showing the {max_edges} rules with the'
+                f' highest {weight_var}' if pruned else '')
     )
     if show:
         fig.show()
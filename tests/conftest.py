@@ -0,0 +1,6 @@
+import sys
+from os.path import abspath, dirname, join
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.append(root)
+sys.path.append(join(root, 'model'))
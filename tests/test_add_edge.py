@@ -0,0 +1,43 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from addEdge import addEdge, add_edges
+
+
+def graph_edges(G: nx.Graph) -> tuple:
+    pos = nx.spring_layout(G, seed=0)
+    edges = list(G.edges())
+    starts = np.array([pos[start] for start, _ in edges])
+    ends = np.array([pos[end] for _, end in edges])
+    return starts, ends
+
+
+GRAPHS = {
+    'star': graph_edges(nx.star_graph(6, create_using=nx.DiGraph)),
+    'random': graph_edges(nx.gnp_random_graph(12, 0.3, seed=1,
+                                              directed=True)),
+    'complete': graph_edges(nx.complete_graph(5, create_using=nx.DiGraph)),
+    # Horizontal, vertical, and every direction of diagonal edges
+    'axes': (
+        np.array([[0, 0], [0, 0], [1, 1], [1, 1], [0, 0], [1, 0]]),
+        np.array([[1, 0], [0, 1], [0, 1], [1, 0], [-1, -1], [0, 1]])
+    ),
+}
+
+
+@pytest.mark.parametrize('graph', GRAPHS)
+@pytest.mark.parametrize('arrowPos', [None, 'end', 'middle'])
+def test_add_edges_matches_addEdge(graph, arrowPos):
+    starts, ends = GRAPHS[graph]
+    kwargs = {'arrowPos': arrowPos, 'arrowLength': 0.04}
+    expected_x, expected_y = [], []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        addEdge(start, end, expected_x, expected_y, **kwargs)
+    edge_x, edge_y = add_edges(starts, ends, **kwargs)
+
+    # addEdge separates the lines with None and add_edges with NaN
+    for found, expected in ((edge_x, expected_x), (edge_y, expected_y)):
+        expected = np.array(expected, dtype=float)
+        assert found.shape == expected.shape
+        np.testing.assert_allclose(found, expected, rtol=1e-12, atol=1e-12)
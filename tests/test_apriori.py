@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import association_rules, fpgrowth
+
+import apriori
+
+METRICS = ['support', 'confidence', 'lift', 'leverage', 'conviction']
+
+
+def baskets(seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        rng.random((200, 10)) < 0.35,
+        columns=[f'item {i}' for i in range(10)]
+    )
+
+
+def by_rule(rules: pd.DataFrame, columns: list) -> dict:
+    return {
+        (antecedent, consequent): tuple(values)
+        for antecedent, consequent, *values in zip(
+            rules['antecedents'],
+            rules['consequents'],
+            *(rules[column] for column in columns)
+        )
+    }
+
+
+def assert_same_rules(found: pd.DataFrame, expected: pd.DataFrame,
+                      columns: list):
+    found, expected = by_rule(found, columns), by_rule(expected, columns)
+    assert found.keys() == expected.keys()
+    for rule, values in expected.items():
+        assert found[rule] == pytest.approx(values)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_generate_rules_matches_association_rules(seed):
+    itemsets = fpgrowth(baskets(seed), min_support=0.05, use_colnames=True)
+    assert_same_rules(
+        apriori.generate_rules(itemsets),
+        association_rules(itemsets, metric='support', min_threshold=0),
+        METRICS
+    )
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('metric, keyword, thresholds', [
+    ('confidence', 'conf_thresh', [0.3, 0.5, 0.8]),
+    ('lift', 'lift_thresh', [0.9, 1, 1.2]),
+    ('leverage', 'lev_thresh', [0, 0.01, 0.03]),
+])
+def test_make_rules_matches_association_rules(
+        seed, metric, keyword, thresholds):
+    one_hot_df = baskets(seed)
+    itemsets = fpgrowth(one_hot_df, min_support=0.05, use_colnames=True)
+    for threshold in thresholds:
+        rules = apriori.make_rules(
+            one_hot_df,
+            min_support=0.05,
+            **{keyword: threshold}
+        )
+        assert_same_rules(
+            getattr(rules, metric),
+            association_rules(
+                itemsets, metric=metric, min_threshold=threshold),
+            [metric]
+        )
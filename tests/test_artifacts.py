@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import artifacts
+from api import payload
+
+
+def rules() -> pd.DataFrame:
+    return pd.DataFrame({
+        'antecedents': [frozenset(['bread']), frozenset(['eggs', 'milk'])],
+        'consequents': [frozenset(['milk']), frozenset(['bread', 'milk'])],
+        'lift': [1.5, 2.0]
+    })
+
+
+def test_payload_round_trip():
+    assert payload.rules_from_arrow(payload.rules_to_arrow(rules())).equals(
+        rules())
+
+
+def test_read_rules_round_trip(tmp_path):
+    path = str(tmp_path / 'rules.arrow')
+    artifacts.write_rules(rules(), path)
+    read = artifacts.read_rules(path)
+    assert read.equals(rules())
+    # The itemsets of a column share one string per distinct item
+    items = [item for itemset in read['consequents'] for item in itemset]
+    assert len({id(item) for item in items}) == len(set(items))
+
+
+def test_empty_rules_round_trip():
+    empty = rules().iloc[:0].reset_index(drop=True)
+    read = payload.rules_from_arrow(payload.rules_to_arrow(empty))
+    assert read.shape == (0, 3)
+    assert np.issubdtype(read['lift'].dtype, np.floating)
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from api import cache
+
+
+def transactions() -> pd.DataFrame:
+    return pd.DataFrame({
+        'InvoiceNo': ['1', '1', '2', '3'],
+        'Description': ['bread', 'milk', 'bread', 'eggs'],
+        'Quantity': [1, 2, 1, 6]
+    })
+
+
+def test_fingerprint_ignores_row_order():
+    df = transactions()
+    assert cache.fingerprint(df) == cache.fingerprint(df.iloc[::-1])
+
+
+def test_fingerprint_changes_with_rows():
+    df = transactions()
+    changed = df.assign(Quantity=[1, 2, 1, 5])
+    assert cache.fingerprint(df) != cache.fingerprint(changed)
+    assert cache.fingerprint(df) != cache.fingerprint(df.iloc[1:])
+    assert cache.fingerprint(df) != cache.fingerprint(
+        pd.concat([df, df.iloc[:1]]))
+
+
+def test_disk_cache_round_trip(tmp_path):
+    rule_cache = cache.DiskRuleCache(str(tmp_path), max_bytes=100, ttl=60)
+    assert rule_cache.get('key') is None
+    rule_cache.put('key', b'rules')
+    assert rule_cache.get('key') == b'rules'
+    assert rule_cache.stats() == {
+        'hits': 1, 'misses': 1, 'entries': 1, 'bytes': 5}
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import fpgrowth
+
+import engines
+
+
+def random_baskets(seed: int, n_rows: int, n_items: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        rng.random((n_rows, n_items)) < rng.uniform(0.1, 0.5),
+        columns=[f'item {i}' for i in range(n_items)]
+    )
+
+
+def supports(itemsets: pd.DataFrame) -> dict:
+    return dict(zip(itemsets['itemsets'], itemsets['support']))
+
+
+def assert_same_itemsets(one_hot_df: pd.DataFrame, min_support: float):
+    expected = supports(fpgrowth(
+        one_hot_df, min_support=min_support, use_colnames=True))
+    found = supports(engines.bitset_itemsets(one_hot_df, min_support))
+    assert found.keys() == expected.keys()
+    for itemset, support in expected.items():
+        assert found[itemset] == pytest.approx(support)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('min_support', [0.05, 0.1, 0.2])
+def test_bitset_matches_fpgrowth(seed, min_support):
+    assert_same_itemsets(random_baskets(seed, 97, 10), min_support)
+
+
+def test_bitset_matches_fpgrowth_on_sparse_baskets():
+    one_hot_df = random_baskets(0, 97, 10).astype(
+        pd.SparseDtype(bool, False))
+    assert_same_itemsets(one_hot_df, 0.1)
+
+
+def test_bitset_matches_fpgrowth_at_the_support_boundary():
+    # 0.28 * 25 is slightly more than 7 in floating point, so fpgrowth
+    # keeps single items in 7 of 25 baskets but not pairs, see min_counts
+    rows = np.arange(25)
+    one_hot_df = pd.DataFrame({
+        'a': rows < 7,
+        'b': rows < 8,
+        'c': (rows >= 5) & (rows < 15),
+        'd': rows >= 15,
+    })
+    assert engines.min_counts(0.28, 25) == (7, 8)
+    assert_same_itemsets(one_hot_df, 0.28)
+    found = supports(engines.bitset_itemsets(one_hot_df, 0.28))
+    assert frozenset(['a']) in found
+    assert frozenset(['a', 'b']) not in found
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from api import db, loader
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.Model.metadata.create_all(engine)
+    return engine
+
+
+def load(engine, invoices) -> int:
+    loader.bulk_load(
+        pd.DataFrame({
+            'InvoiceNo': invoices,
+            'Description': ['bread'] * len(invoices),
+            'Quantity': [1] * len(invoices)
+        }),
+        engine,
+        'dataset'
+    )
+    return loader.last_row_id(engine, 'dataset')
+
+
+def test_csv_stream_reads_every_batch():
+    df = pd.DataFrame({
+        'InvoiceNo': [str(i) for i in range(25)],
+        'Description': ['bread', None] * 12 + ['milk'],
+        'Quantity': range(25)
+    })
+    expected = ''.join(
+        frame.to_csv(header=False, index=False)
+        for frame in loader.iter_frames(df, 'dataset', batch_size=10)
+    )
+    for size in (1, 7, 64, len(expected) + 1):
+        stream = loader.CsvStream(
+            loader.iter_frames(df, 'dataset', batch_size=10))
+        chunks = iter(lambda: stream.read(size), '')
+        assert ''.join(chunks) == expected
+    stream = loader.CsvStream(loader.iter_frames(df, 'dataset', batch_size=10))
+    assert stream.read(5) + stream.read() == expected
+    assert stream.read() == ''
+
+
+def test_appends_to_new_invoices(engine):
+    mined = load(engine, ['1', '2'])
+    load(engine, ['3', '3'])
+    assert not loader.appends_to_invoices(engine, 'dataset', mined)
+
+
+def test_appends_to_earlier_invoices(engine):
+    mined = load(engine, ['1', '2'])
+    last = load(engine, ['3', '2'])
+    load(engine, ['1'])
+    assert loader.appends_to_invoices(engine, 'dataset', mined)
+    assert loader.appends_to_invoices(engine, 'dataset', mined, last)
+    assert not loader.appends_to_invoices(
+        engine, 'dataset', mined, mined + 1)
@@ -0,0 +1,39 @@
+import billiard
+import numpy as np
+import pandas as pd
+
+import apriori
+import engines
+import parallel
+
+
+def baskets(n_rows: int = 2 * parallel.MIN_PARTITION_TRANSACTIONS,
+            n_items: int = 12) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        rng.random((n_rows, n_items)) < 0.3,
+        columns=[f'item {i}' for i in range(n_items)]
+    )
+
+
+def mine(n_jobs: int) -> apriori.Rules:
+    return apriori.make_rules(baskets(), min_support=0.05, n_jobs=n_jobs)
+
+
+def test_parallel_matches_serial():
+    rules = mine(n_jobs=2)
+    assert rules.engine == 'parallel'
+    assert rules.table.equals(mine(n_jobs=1).table)
+
+
+def test_daemonic_process_mines_serially():
+    # Celery's prefork workers are daemonic billiard processes
+    with billiard.Pool(1) as pool:
+        rules = pool.apply(mine, (2,))
+    assert rules.engine == 'bitset'
+    assert rules.table.equals(mine(n_jobs=1).table)
+
+
+def test_parallel_follows_choose_engine(monkeypatch):
+    monkeypatch.setattr(engines, 'BITSET_MIN_DENSITY', 0.5)
+    assert mine(n_jobs=2).engine == 'fpgrowth'
@@ -0,0 +1,28 @@
+import pytest
+
+import apriori
+import engines
+from benchmarks.generator import quest_transactions
+
+
+def actual_counts(df, min_support: float) -> tuple:
+    itemsets = engines.bitset_itemsets(
+        apriori.count_items_per_transaction(df), min_support)
+    rules = itemsets['itemsets'].map(len).map(engines.rules_per_itemset)
+    return len(itemsets), int(rules.sum())
+
+
+@pytest.mark.parametrize('n_invoices, n_items, min_support', [
+    # Smaller than the sample, which is then the whole upload
+    (1_000, 100, 0.05),
+    (20_000, 500, 0.02)
+])
+def test_estimate_matches_actual_counts(n_invoices, n_items, min_support):
+    df = apriori.prepare_data(quest_transactions(
+        n_invoices=n_invoices, n_items=n_items, seed=0))
+    estimate = apriori.estimate_upload(df, min_support)
+    itemsets, rules = actual_counts(df, min_support)
+    if n_invoices <= apriori.SAMPLE_INVOICES:
+        assert (estimate.itemsets, estimate.rules) == (itemsets, rules)
+    assert estimate.itemsets == pytest.approx(itemsets, rel=0.25)
+    assert estimate.rules == pytest.approx(rules, rel=0.25)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from recommend import RecommendIndex, recommend_baskets
+
+ITEMS = [f'item {i}' for i in range(15)]
+
+
+def random_rules(seed: int, n_rules: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    antecedents, consequents = [], []
+    for _ in range(n_rules):
+        items = rng.choice(len(ITEMS), rng.integers(2, 6), replace=False)
+        split = rng.integers(1, min(len(items), 4))
+        antecedents.append(frozenset(ITEMS[i] for i in items[:split]))
+        consequents.append(frozenset(ITEMS[i] for i in items[split:]))
+    lift = rng.uniform(0.5, 3, n_rules)
+    lift[rng.random(n_rules) < 0.1] = np.nan
+    return pd.DataFrame({
+        'antecedents': antecedents,
+        'consequents': consequents,
+        'confidence': rng.random(n_rules),
+        'lift': lift
+    })
+
+
+def random_baskets(seed: int, n_baskets: int = 50) -> list:
+    rng = np.random.default_rng(seed)
+    # Baskets may hold an item that no rule has
+    items = ITEMS + ['unknown']
+    return [
+        frozenset(rng.choice(items, rng.integers(0, 7), replace=False))
+        for _ in range(n_baskets)
+    ]
+
+
+def naive_scores(rules: pd.DataFrame, basket: frozenset,
+                 metric: str) -> dict:
+    """ The best score of every item recommended to a basket, from a loop
+        over every rule
+    """
+    scores = {}
+    for antecedent, consequent, score in zip(
+            rules['antecedents'], rules['consequents'], rules[metric]):
+        if np.isnan(score) or not antecedent <= basket:
+            continue
+        for item in consequent - basket:
+            scores[item] = max(score, scores.get(item, -np.inf))
+    return scores
+
+
+def assert_top_n(found: dict, ranked_scores: list, expected: dict, n: int):
+    """ The items found have their best scores and are the best n, in
+        order, whichever of the items with equal scores were kept
+    """
+    assert len(found) == min(n, len(expected))
+    for item, score in found.items():
+        assert score == pytest.approx(expected[item])
+    best = sorted(expected.values(), reverse=True)[:n]
+    assert ranked_scores == pytest.approx(best)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('metric', ['confidence', 'lift'])
+@pytest.mark.parametrize('n', [1, 3, 100])
+def test_recommend_matches_naive_loop(seed, metric, n):
+    rules = random_rules(seed)
+    index = RecommendIndex(rules)
+    rule_scores = {}
+    for antecedent, consequent, score in zip(
+            rules['antecedents'], rules['consequents'], rules[metric]):
+        for item in consequent:
+            rule_scores.setdefault((antecedent, item), []).append(score)
+    for basket in random_baskets(seed):
+        recommendations = index.recommend(basket, metric, n)
+        assert_top_n(
+            {r['item']: r[metric] for r in recommendations},
+            [r[metric] for r in recommendations],
+            naive_scores(rules, basket, metric),
+            n
+        )
+        for r in recommendations:
+            # The antecedents are those of a fired rule with that score
+            antecedent = frozenset(r['antecedents'])
+            assert antecedent <= basket
+            assert r[metric] in rule_scores[antecedent, r['item']]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('metric', ['confidence', 'lift'])
+@pytest.mark.parametrize('n', [1, 3, 100])
+def test_recommend_baskets_matches_naive_loop(seed, metric, n):
+    rules = random_rules(seed)
+    baskets = random_baskets(seed)
+    columns = ITEMS + ['unknown']
+    rows, cols = zip(*(
+        (row, columns.index(item))
+        for row, basket in enumerate(baskets) for item in basket
+    ))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)),
+        shape=(len(baskets), len(columns))
+    )
+    invoices = [f'invoice {i}' for i in range(len(baskets))]
+    recommendations = pd.concat(recommend_baskets(
+        RecommendIndex(rules), matrix, invoices, columns, metric, n,
+        batch=7
+    ))
+    by_invoice = dict(tuple(recommendations.groupby('InvoiceNo')))
+    for invoice, basket in zip(invoices, baskets):
+        expected = naive_scores(rules, basket, metric)
+        found = by_invoice.get(invoice, recommendations.iloc[:0])
+        assert found['rank'].tolist() == list(range(1, len(found) + 1))
+        assert_top_n(
+            dict(zip(found['item'], found[metric])),
+            found[metric].tolist(),
+            expected,
+            n
+        )
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import visualize
+
+
+def stars(n_components: int, leaves: int) -> tuple:
+    """ Edges of disconnected stars, items that all imply one item """
+    return tuple(
+        (f'{c} item {i}', f'{c} hub')
+        for c in range(n_components) for i in range(leaves)
+    )
+
+
+def min_distance(positions: dict) -> float:
+    coords = np.array(list(positions.values()))
+    distances = np.linalg.norm(coords[:, None] - coords[None], axis=-1)
+    return distances[~np.eye(len(coords), dtype=bool)].min()
+
+
+@pytest.mark.parametrize('layout', ['auto', 'spectral', 'spring'])
+def test_disconnected_components_do_not_overlap(layout):
+    n_components = 6
+    edges = stars(n_components, visualize.FAST_LAYOUT_NODES // 5)
+    positions = visualize.network_layout(edges, layout)
+    assert len(positions) > visualize.FAST_LAYOUT_NODES
+    assert min_distance(positions) > 1e-6
+    boxes = [
+        np.array([positions[node] for node in positions
+                  if node.startswith(f'{c} ')])
+        for c in range(n_components)
+    ]
+    for i, box in enumerate(boxes):
+        for other in boxes[i + 1:]:
+            assert (box.max(axis=0) < other.min(axis=0)).any() \
+                or (other.max(axis=0) < box.min(axis=0)).any()
+
+
+def test_pairs_and_singletons_are_placed():
+    edges = stars(3, 1) + (('alone', 'alone'),)
+    positions = visualize.network_layout(edges, 'spectral')
+    assert len(positions) == 7
+    assert min_distance(positions) > 1e-6
@@ -1,6 +1,10 @@
-from api import create_app
+from api import create_app, demo
 
 app = create_app()
+demo.warm()
+# Compile every template now, so that preloaded workers share them
+for template in app.jinja_env.list_templates():
+    app.jinja_env.get_template(template)
 
 if __name__ == '__main__':
     app.run()